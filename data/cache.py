@@ -0,0 +1,171 @@
+"""
+A read-through cache for single-doc lookups in data.db_connect.
+Entries expire after a per-collection TTL, and the least recently used
+entry is evicted once the cache is full.
+Any write to a collection invalidates everything cached for it: each
+collection has a generation number that is part of every key, so
+bumping it orphans the old entries, which then age out of the LRU.
+
+LocalCache keeps everything in this process. A shared backend (say,
+Redis) only needs to implement the CacheBackend methods.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+DEF_MAX_SIZE = 10_000
+
+# stats keys:
+HITS = 'hits'
+MISSES = 'misses'
+EVICTIONS = 'evictions'
+SIZE = 'size'
+
+
+class CacheBackend:
+    """
+    What a cache backend must provide.
+    get() returns (found, value) so that None can be cached too.
+    """
+    def get(self, key):
+        raise NotImplementedError()
+
+    def set(self, key, value, ttl: float):
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+    def get_generation(self, namespace) -> int:
+        raise NotImplementedError()
+
+    def bump_generation(self, namespace) -> int:
+        raise NotImplementedError()
+
+    def stats(self) -> dict:
+        return {}
+
+
+class LocalCache(CacheBackend):
+    """
+    An in-process LRU cache with per-entry expiry. Thread safe.
+    """
+    def __init__(self, max_size: int = DEF_MAX_SIZE, clock=time.monotonic):
+        self.max_size = max_size
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.generations = {}
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at <= self.clock():
+                del self.entries[key]
+                return False, None
+            self.entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, ttl: float):
+        with self.lock:
+            self.entries[key] = (self.clock() + ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.generations.clear()
+
+    def get_generation(self, namespace) -> int:
+        with self.lock:
+            return self.generations.get(namespace, 0)
+
+    def bump_generation(self, namespace) -> int:
+        with self.lock:
+            gen = self.generations.get(namespace, 0) + 1
+            self.generations[namespace] = gen
+            return gen
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {SIZE: len(self.entries), EVICTIONS: self.evictions}
+
+
+class ReadCache:
+    """
+    Sits in front of one-doc reads. Only collections given a TTL through
+    configure() are cached. Values are copied on the way in and out, so
+    callers can't change what's cached by editing what they got back.
+    """
+    def __init__(self, backend: CacheBackend = None):
+        self.backend = backend or LocalCache()
+        self.ttls = {}
+        self.enabled = True
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def configure(self, collection: str, ttl: float):
+        """
+        Cache reads from collection for ttl seconds; a ttl of 0 or
+        None stops caching it.
+        """
+        if ttl:
+            self.ttls[collection] = ttl
+        else:
+            self.ttls.pop(collection, None)
+
+    def set_backend(self, backend: CacheBackend):
+        self.backend = backend
+
+    def is_cached(self, collection: str) -> bool:
+        return self.enabled and collection in self.ttls
+
+    def make_key(self, db, collection, *args):
+        gen = self.backend.get_generation((db, collection))
+        return (db, collection, gen) + tuple(repr(arg) for arg in args)
+
+    def count(self, collection: str, stat: str):
+        with self.lock:
+            counts = self.counts.setdefault(collection, {HITS: 0, MISSES: 0})
+            counts[stat] += 1
+
+    def read_through(self, db, collection, key_args: tuple, load):
+        """
+        Return the cached value for key_args, or call load() and cache
+        what it returns.
+        """
+        if not self.is_cached(collection):
+            return load()
+        key = self.make_key(db, collection, *key_args)
+        found, value = self.backend.get(key)
+        if found:
+            self.count(collection, HITS)
+            return copy.deepcopy(value)
+        self.count(collection, MISSES)
+        value = load()
+        self.backend.set(key, copy.deepcopy(value), self.ttls[collection])
+        return value
+
+    def invalidate(self, db, collection):
+        if collection in self.ttls:
+            self.backend.bump_generation((db, collection))
+
+    def clear(self):
+        self.backend.clear()
+        with self.lock:
+            self.counts = {}
+
+    def stats(self) -> dict:
+        with self.lock:
+            ret = {collection: dict(counts)
+                   for collection, counts in self.counts.items()}
+        ret.update(self.backend.stats())
+        return ret
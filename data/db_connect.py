@@ -2,9 +2,15 @@
 All interaction with MongoDB should be through this file!
 We may be required to use a new database at any point.
 """
+import copy
 import os
+import threading
+from contextlib import contextmanager
 
 import pymongo as pm
+from pymongo import monitoring
+
+import data.cache as cache
 
 LOCAL = "0"
 CLOUD = "1"
@@ -15,18 +21,256 @@ client = None
 
 MONGO_ID = '_id'
 
+DEFAULT_BATCH_SIZE = 500
+
+# bulk write result keys:
+MATCHED = 'matched'
+MODIFIED = 'modified'
+
+# Pool settings, read from the environment so each deployment can size
+# its pools without a code change. Unset means "use pymongo's default".
+POOL_ENV_VARS = {
+    'maxPoolSize': 'MONGO_MAX_POOL_SIZE',
+    'minPoolSize': 'MONGO_MIN_POOL_SIZE',
+    'connectTimeoutMS': 'MONGO_CONNECT_TIMEOUT_MS',
+    'socketTimeoutMS': 'MONGO_SOCKET_TIMEOUT_MS',
+    'serverSelectionTimeoutMS': 'MONGO_SERVER_SELECTION_TIMEOUT_MS',
+}
+
+pool_overrides = {}
+
+# pool stats keys:
+CREATED = 'created'
+CLOSED = 'closed'
+CHECKED_OUT = 'checked_out'
+WAITING = 'waiting'
+CHECK_OUT_FAILED = 'check_out_failed'
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """
+    Counts connection pool events so we can size pools under load.
+    `checked_out` and `waiting` are current levels; the rest are totals.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = {
+                CREATED: 0,
+                CLOSED: 0,
+                CHECKED_OUT: 0,
+                WAITING: 0,
+                CHECK_OUT_FAILED: 0,
+            }
+
+    def bump(self, stat: str, amount: int = 1):
+        with self.lock:
+            self.counts[stat] += amount
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.counts)
+
+    def connection_created(self, event):
+        self.bump(CREATED)
+
+    def connection_closed(self, event):
+        self.bump(CLOSED)
+
+    def connection_check_out_started(self, event):
+        self.bump(WAITING)
+
+    def connection_check_out_failed(self, event):
+        self.bump(WAITING, -1)
+        self.bump(CHECK_OUT_FAILED)
+
+    def connection_checked_out(self, event):
+        self.bump(WAITING, -1)
+        self.bump(CHECKED_OUT)
+
+    def connection_checked_in(self, event):
+        self.bump(CHECKED_OUT, -1)
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+
+pool_stats = PoolStats()
+
+# Read-through cache for fetch_one() and read_one(). Each data module
+# opts its collections in with cache_reads(); DB_CACHE=off turns it off.
+CACHE_ENV = 'DB_CACHE'
+CACHE_OFF = 'off'
+
+read_cache = cache.ReadCache()
+read_cache.enabled = os.environ.get(CACHE_ENV) != CACHE_OFF
+
+
+def get_pool_config() -> dict:
+    """
+    Pool settings to pass to MongoClient: env vars first, then anything
+    set through configure_pool().
+    """
+    config = {}
+    for option, env_var in POOL_ENV_VARS.items():
+        value = os.environ.get(env_var)
+        if value:
+            config[option] = int(value)
+    config.update(pool_overrides)
+    return config
+
+
+def configure_pool(**options):
+    """
+    Override pool settings (maxPoolSize=..., connectTimeoutMS=..., etc.)
+    The next DB call reconnects with the new settings.
+    """
+    for option in options:
+        if option not in POOL_ENV_VARS:
+            raise ValueError(f'Unknown pool option: {option}')
+    pool_overrides.update(options)
+    close_db()
+
+
+def get_pool_stats() -> dict:
+    return pool_stats.snapshot()
+
+
+def cache_reads(collection, ttl: float):
+    """
+    Serve fetch_one() and read_one() on collection from the cache for
+    up to ttl seconds. Our own writes invalidate it right away.
+    """
+    read_cache.configure(collection, ttl)
+
+
+def set_cache_backend(backend: cache.CacheBackend):
+    read_cache.set_backend(backend)
+
+
+# Per-request identity map: within one request each one-doc lookup
+# goes to the cache or DB at most once. The server installs a provider
+# that returns a dict scoped to the current request, or None outside one.
+identity_map_provider = None
+
+
+def set_identity_map_provider(provider):
+    global identity_map_provider
+    identity_map_provider = provider
+
+
+def get_identity_map():
+    if identity_map_provider is None:
+        return None
+    return identity_map_provider()
+
+
+def invalidate(collection, db=SE_DB):
+    """
+    Drop everything cached for collection. Every write helper here
+    calls this; call it yourself after writing around this module.
+    """
+    read_cache.invalidate(db, collection)
+    id_map = get_identity_map()
+    if id_map is not None:
+        id_map.pop((db, collection), None)
+
+
+# Per-collection version counters, kept in the DB so every process
+# sees the same numbers. Collections opt in with track_versions();
+# each write through this module bumps the counter.
+VERSIONS_COLLECT = 'versions'
+VERSION = 'version'
+
+versioned = set()
+
+
+def track_versions(collection):
+    versioned.add(collection)
+
+
+def bump_version(collection, db=SE_DB):
+    get_collection(VERSIONS_COLLECT, db).update_one(
+        {MONGO_ID: collection}, {'$inc': {VERSION: 1}}, upsert=True,
+    )
+
+
+def get_version(collection, db=SE_DB) -> int:
+    """
+    The collection's version counter: one small, uncached read.
+    """
+    doc = get_collection(VERSIONS_COLLECT, db).find_one(
+        {MONGO_ID: collection}, {VERSION: 1},
+    )
+    return doc[VERSION] if doc else 0
+
+
+@contextmanager
+def writing(collection, db=SE_DB):
+    """
+    Wrap every write to collection. Afterwards (even if the write
+    failed part way) drop the collection's cached reads and bump its
+    version. Doing this after the write means no reader can cache the
+    old doc under the new generation or version.
+    """
+    try:
+        yield
+    finally:
+        invalidate(collection, db)
+        if collection in versioned:
+            bump_version(collection, db)
+
+
+def read_through(collection, filt, db, projection, load):
+    """
+    One-doc read through the identity map, then the read cache.
+    """
+    id_map = get_identity_map()
+    if id_map is None:
+        return read_cache.read_through(db, collection, (filt, projection),
+                                       load)
+    docs = id_map.setdefault((db, collection), {})
+    key = (repr(filt), repr(projection))
+    if key not in docs:
+        docs[key] = read_cache.read_through(db, collection,
+                                            (filt, projection), load)
+    return copy.deepcopy(docs[key])
+
+
+def clear_cache():
+    read_cache.clear()
+
+
+def get_cache_stats() -> dict:
+    return read_cache.stats()
+
 
 def connect_db():
     """
     This provides a uniform way to connect to the DB across all uses.
-    Returns a mongo client object... maybe we shouldn't?
-    Also set global client variable.
-    We should probably either return a client OR set a
-    client global.
+    Connects lazily: nothing talks to Mongo until the first DB call,
+    so importing a data module never opens a connection.
+    Returns the shared mongo client.
     """
     global client
     if client is None:  # not connected yet!
         print("Setting client because it is None.")
+        pool_config = get_pool_config()
         if os.environ.get("CLOUD_MONGO", LOCAL) == CLOUD:
             password = os.environ.get("GAME_MONGO_PW")
             if not password:
@@ -38,19 +282,87 @@ def connect_db():
                 f'404-error-not-found:{password}'
                 '@cluster0.cmb6h.mongodb.net/'
                 '?retryWrites=true&w=majority&appName=Cluster0',
+                event_listeners=[pool_stats],
+                **pool_config,
             )
         else:
             print("Connecting to Mongo locally.")
-            client = pm.MongoClient()
+            client = pm.MongoClient(event_listeners=[pool_stats],
+                                    **pool_config)
     return client
 
 
+def close_db():
+    global client
+    if client is not None:
+        client.close()
+    client = None
+
+
+def reinit_after_fork():
+    """
+    A MongoClient must not be shared across fork(): drop the parent's
+    client (without closing its sockets, which the parent still owns)
+    so the child connects fresh on first use.
+    Pre-fork servers can also call this from a post-fork hook.
+    """
+    global client
+    client = None
+    pool_stats.reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=reinit_after_fork)
+
+
+def get_collection(collection, db=SE_DB):
+    return connect_db()[db][collection]
+
+
 def create(collection, doc, db=SE_DB):
     """
     Insert a single doc into collection.
     """
     print(f'{db=}')
-    return client[db][collection].insert_one(doc)
+    with writing(collection, db):
+        return get_collection(collection, db).insert_one(doc)
+
+
+def insert_if_absent(collection, key_filt, doc, db=SE_DB) -> bool:
+    """
+    Insert doc unless a doc matching key_filt already exists, in one
+    round trip. Race-free when key_filt's fields have a unique index:
+    the loser of a race gets a duplicate key error, which we report the
+    same way as finding the doc.
+    Returns True if doc was inserted.
+    """
+    new_fields = {fld: val for fld, val in doc.items() if fld not in key_filt}
+    try:
+        with writing(collection, db):
+            result = get_collection(collection, db).update_one(
+                key_filt, {'$setOnInsert': new_fields}, upsert=True,
+            )
+    except pm.errors.DuplicateKeyError:
+        return False
+    return result.upserted_id is not None
+
+
+def insert_many(collection, docs: list, db=SE_DB, ordered=False) -> dict:
+    """
+    Insert a batch of docs in one round trip. Unordered by default, so
+    one bad doc doesn't stop the rest.
+    Returns {index in docs: error message} for the docs that failed.
+    """
+    if not docs:
+        return {}
+    try:
+        with writing(collection, db):
+            get_collection(collection, db).insert_many(docs,
+                                                       ordered=ordered)
+    except pm.errors.BulkWriteError as err:
+        return {write_err['index']: write_err['errmsg']
+                for write_err in err.details['writeErrors']}
+    return {}
 
 
 # def fetch_one(collection, filt, db=SE_DB):
@@ -64,34 +376,41 @@ def create(collection, doc, db=SE_DB):
 #             doc[MONGO_ID] = str(doc[MONGO_ID])
 #         return doc
 
-def fetch_one(collection, filt, db=SE_DB):
+def fetch_one(collection, filt, db=SE_DB, projection=None):
     """
     Find a document with a filter and return the first document found.
-    Converts the MongoDB `_id` to a string for JSON compatibility.
     Returns None if no document is found.
+    A projection limits the fields sent back.
+    Served from the read cache if collection is cached.
     """
+    def load():
+        return get_collection(collection, db).find_one(filt, projection)
+
     try:
-        doc = client[db][collection].find_one(filt)
-        if doc and MONGO_ID in doc:
-            # Convert MongoDB ObjectID to string
-            doc[MONGO_ID] = str(doc[MONGO_ID])
-        return doc
+        return read_through(collection, filt, db, projection, load)
     except Exception as e:
         print(f"Error in fetch_one: {e}")
         return None
 
 
-def read_one(collection, filt, db=SE_DB):
+def read_one(collection, filt, db=SE_DB, projection=None):
     """
     Find with a filter and return on the first doc found
     Return None if not found.
+    A projection limits the fields sent back.
+    Served from the read cache if collection is cached.
     """
-    for doc in client[db][collection].find(filt):
-        convert_mongo_id(doc)
-        return doc
+    def load():
+        return get_collection(collection, db).find_one(filt, projection)
+
+    return read_through(collection, filt, db, projection, load)
 
 
 def convert_mongo_id(doc: dict):
+    """
+    Docs keep their ObjectId: the server's JSON encoder writes it out
+    as a string. Use this only to hand a doc to some other encoder.
+    """
     if MONGO_ID in doc:
         # Convert mongo ID to a string so it works as JSON
         doc[MONGO_ID] = str(doc[MONGO_ID])
@@ -102,37 +421,180 @@ def delete(collection: str, filt: dict, db=SE_DB):
     Find with a filter and return on the first doc found.
     """
     print(f'{filt=}')
-    del_result = client[db][collection].delete_one(filt)
+    with writing(collection, db):
+        del_result = get_collection(collection, db).delete_one(filt)
     return del_result.deleted_count
 
 
 def update_doc(collection, filters, update_dict, db=SE_DB):
-    return client[db][collection].update_one(filters, {'$set': update_dict})
+    with writing(collection, db):
+        return get_collection(collection, db).update_one(
+            filters, {'$set': update_dict},
+        )
+
+
+def replace_doc(collection, filters, doc, db=SE_DB, upsert=False):
+    """
+    Replace the whole of the first doc matching filters.
+    """
+    with writing(collection, db):
+        return get_collection(collection, db).replace_one(filters, doc,
+                                                          upsert=upsert)
+
+
+def update_and_fetch(collection, filters, update_dict, db=SE_DB,
+                     projection=None, upsert=False, return_new=True):
+    """
+    Atomically $set update_dict on the first doc matching filters and
+    return it, in one round trip. Returns the doc as it is after the
+    update, or as it was before if return_new is False.
+    Returns None if nothing matched (and upsert is off).
+    """
+    return_doc = (pm.ReturnDocument.AFTER if return_new
+                  else pm.ReturnDocument.BEFORE)
+    with writing(collection, db):
+        doc = get_collection(collection, db).find_one_and_update(
+            filters, {'$set': update_dict}, projection=projection,
+            upsert=upsert, return_document=return_doc,
+        )
+    return doc
 
 
-def read(collection, db=SE_DB, no_id=True) -> list:
+def modify_doc(collection, filters, update_ops, db=SE_DB, upsert=False):
+    """
+    Apply raw update operators ($push, $pull, $inc...) to one doc.
+    """
+    with writing(collection, db):
+        return get_collection(collection, db).update_one(
+            filters, update_ops, upsert=upsert,
+        )
+
+
+def bulk_update(collection, updates: list, db=SE_DB,
+                ordered=True) -> dict:
+    """
+    Apply many (filter, update operators) pairs in one round trip.
+    Ordered, so later updates see the effects of earlier ones.
+    Returns the matched and modified counts.
+    """
+    if not updates:
+        return {MATCHED: 0, MODIFIED: 0}
+    requests = [pm.UpdateOne(filt, update_ops)
+                for filt, update_ops in updates]
+    with writing(collection, db):
+        result = get_collection(collection, db).bulk_write(requests,
+                                                           ordered=ordered)
+    return {MATCHED: result.matched_count, MODIFIED: result.modified_count}
+
+
+def read_iter(collection, db=SE_DB, no_id=True, filt=None,
+              projection=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Stream docs from the db one at a time.
+    The cursor pulls batch_size docs per round trip, so memory use stays
+    flat however big the collection is.
+    """
+    cursor = get_collection(collection, db).find(filt or {}, projection,
+                                                 batch_size=batch_size)
+    for doc in cursor:
+        if no_id:
+            doc.pop(MONGO_ID, None)
+        yield doc
+
+
+def read(collection, db=SE_DB, no_id=True, filt=None,
+         projection=None) -> list:
     """
     Returns a list from the db.
+    An optional filter and projection narrow what the server sends back.
+    """
+    return list(read_iter(collection, db=db, no_id=no_id, filt=filt,
+                          projection=projection))
+
+
+def read_dict_iter(collection, key, db=SE_DB, no_id=True, filt=None,
+                   projection=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Stream (key value, doc) pairs: the streaming form of read_dict().
+    """
+    for rec in read_iter(collection, db=db, no_id=no_id, filt=filt,
+                         projection=projection, batch_size=batch_size):
+        yield rec[key], rec
+
+
+def read_page(collection, key, limit, after=None, db=SE_DB, no_id=True,
+              filt=None, projection=None) -> tuple:
+    """
+    Keyset pagination: up to `limit` docs sorted on `key`, starting just
+    past the key value `after`. With an index on `key` every page costs
+    the same as the first.
+    Returns (docs, next_after); next_after is None on the last page.
     """
-    ret = []
-    for doc in client[db][collection].find():
+    query = dict(filt or {})
+    if after is not None:
+        page_cond = {key: {'$gt': after}}
+        query = {'$and': [query, page_cond]} if query else page_cond
+    if projection and any(projection.values()):
+        projection = {**projection, key: 1}
+    cursor = get_collection(collection, db).find(query, projection)
+    cursor = cursor.sort(key, pm.ASCENDING).limit(limit + 1)
+    docs = []
+    for doc in cursor:
         if no_id:
-            del doc[MONGO_ID]
-        ret.append(doc)
-    return ret
+            doc.pop(MONGO_ID, None)
+        docs.append(doc)
+    next_after = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_after = docs[-1][key]
+    return docs, next_after
+
+
+ensured_indexes = set()
+
+
+def create_index(collection, keys: list, db=SE_DB, unique=False) -> str:
+    """
+    Create an index from a list of (field, direction) pairs.
+    Idempotent: Mongo does nothing if the same index already exists.
+    Returns the index name.
+    """
+    return get_collection(collection, db).create_index(keys, unique=unique)
+
+
+def index_information(collection, db=SE_DB) -> dict:
+    """
+    The collection's indexes, keyed on index name.
+    """
+    return get_collection(collection, db).index_information()
+
+
+def ensure_index(collection, key, db=SE_DB, unique=False):
+    """
+    Create an ascending index on key once per process.
+    Index creation is idempotent on the server; we just skip the call
+    after the first time. Failures (e.g. duplicate values blocking a
+    unique index) are reported but do not break the read that asked.
+    """
+    if (db, collection, key) in ensured_indexes:
+        return
+    ensured_indexes.add((db, collection, key))
+    try:
+        create_index(collection, [(key, pm.ASCENDING)], db=db,
+                     unique=unique)
+    except Exception as e:
+        print(f"Could not create index on {collection}.{key}: {e}")
 
 
-def read_dict(collection, key, db=SE_DB, no_id=True) -> dict:
-    recs = read(collection, db=db, no_id=no_id)
-    recs_as_dict = {}
-    for rec in recs:
-        recs_as_dict[rec[key]] = rec
-    return recs_as_dict
+def read_dict(collection, key, db=SE_DB, no_id=True, filt=None,
+              projection=None) -> dict:
+    return dict(read_dict_iter(collection, key, db=db, no_id=no_id,
+                               filt=filt, projection=projection))
 
 
 def fetch_all_as_dict(key, collection, db=SE_DB):
     ret = {}
-    for doc in client[db][collection].find():
+    for doc in get_collection(collection, db).find():
         del doc[MONGO_ID]
         ret[doc[key]] = doc
     return ret
@@ -0,0 +1,153 @@
+"""
+This module declares the indexes our hot lookups depend on,
+and creates or verifies them through data.db_connect.
+"""
+import argparse
+import os
+import sys
+
+import data.db_connect as dbc
+import data.people as ppl
+import data.text as txt
+import data.manuscripts.manuscript as mt
+import security.security as sec
+
+KEYS = 'keys'
+UNIQUE = 'unique'
+
+ASC = 1
+
+# What the server does about missing indexes at startup:
+INDEX_CHECK_ENV = 'INDEX_CHECK'
+CHECK_OFF = 'off'
+CHECK_LOG = 'log'
+CHECK_FAIL = 'fail'
+CHECK_CREATE = 'create'
+CHECK_MODES = [CHECK_OFF, CHECK_LOG, CHECK_FAIL, CHECK_CREATE]
+DEF_CHECK_MODE = CHECK_LOG
+
+REQUIRED_INDEXES = {
+    ppl.PEOPLE_COLLECT: [
+        {KEYS: [(ppl.EMAIL, ASC)], UNIQUE: True},
+        {KEYS: [(ppl.ROLES, ASC)], UNIQUE: False},
+    ],
+    ppl.USER_COLLECT: [
+        {KEYS: [(ppl.EMAIL, ASC)], UNIQUE: True},
+        {KEYS: [(ppl.USER_ROLE, ASC), (ppl.EMAIL, ASC)], UNIQUE: False},
+    ],
+    mt.MANUSCRIPTS_COLLECT: [
+        {KEYS: [(mt.TITLE, ASC)], UNIQUE: True},
+        {KEYS: [(mt.STATE, ASC), (mt.TITLE, ASC)], UNIQUE: False},
+        {KEYS: [(mt.EDITOR_EMAIL, ASC), (mt.STATE, ASC)], UNIQUE: False},
+    ],
+    mt.BODIES_COLLECT: [
+        {KEYS: [(mt.MANU_ID, ASC)], UNIQUE: True},
+    ],
+    ppl.MASTHEAD_COLLECT: [
+        {KEYS: [(ppl.MH_KEY, ASC)], UNIQUE: True},
+    ],
+    txt.TEXT_COLLECT: [
+        {KEYS: [(txt.KEY, ASC)], UNIQUE: True},
+    ],
+    sec.COLLECT_NAME: [
+        {KEYS: [(sec.FEATURE_NAME, ASC)], UNIQUE: True},
+    ],
+}
+
+
+def get_required_indexes() -> dict:
+    return REQUIRED_INDEXES
+
+
+def has_index(existing: dict, spec: dict) -> bool:
+    """
+    Is there an index with the same keys (and uniqueness, if required)
+    among `existing`, as returned by dbc.index_information()?
+    Matches on keys, not name, so hand-named indexes count.
+    Directions compare by value: Mongo may report 1 as 1.0, and text or
+    2dsphere indexes have string directions.
+    """
+    want_keys = [tuple(key) for key in spec[KEYS]]
+    for info in existing.values():
+        have_keys = [tuple(key) for key in info['key']]
+        if have_keys != want_keys:
+            continue
+        if spec[UNIQUE] and not info.get(UNIQUE, False):
+            continue
+        return True
+    return False
+
+
+def get_missing(db=dbc.SE_DB) -> list:
+    """
+    Returns a list of (collection, spec) for every required index
+    that is not in the DB.
+    """
+    missing = []
+    for collection, specs in get_required_indexes().items():
+        existing = dbc.index_information(collection, db=db)
+        for spec in specs:
+            if not has_index(existing, spec):
+                missing.append((collection, spec))
+    return missing
+
+
+def create_all(db=dbc.SE_DB) -> list:
+    """
+    Create every required index. Safe to run any number of times.
+    Returns the index names.
+    """
+    names = []
+    for collection, specs in get_required_indexes().items():
+        for spec in specs:
+            names.append(dbc.create_index(collection, spec[KEYS], db=db,
+                                          unique=spec[UNIQUE]))
+    return names
+
+
+def describe(missing: list) -> str:
+    return ', '.join(f'{collection}{spec[KEYS]}'
+                     + (' (unique)' if spec[UNIQUE] else '')
+                     for collection, spec in missing)
+
+
+def check(mode: str = None, db=dbc.SE_DB) -> list:
+    """
+    The startup check. `mode` defaults to the INDEX_CHECK env var:
+        - off: do nothing.
+        - log: report missing indexes.
+        - fail: raise RuntimeError if any are missing.
+        - create: create them.
+    Returns whatever is still missing.
+    """
+    if mode is None:
+        mode = os.environ.get(INDEX_CHECK_ENV, DEF_CHECK_MODE)
+    if mode not in CHECK_MODES:
+        raise ValueError(f'Bad {INDEX_CHECK_ENV} mode: {mode}')
+    if mode == CHECK_OFF:
+        return []
+    if mode == CHECK_CREATE:
+        create_all(db=db)
+    missing = get_missing(db=db)
+    if missing:
+        if mode == CHECK_FAIL:
+            raise RuntimeError(f'Missing indexes: {describe(missing)}')
+        print(f'WARNING: missing indexes: {describe(missing)}')
+    return missing
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage DB indexes.')
+    parser.add_argument('command', choices=['create', 'verify'])
+    args = parser.parse_args()
+    if args.command == 'create':
+        print(f'Indexes: {create_all()}')
+    missing = get_missing()
+    if missing:
+        print(f'Missing indexes: {describe(missing)}')
+        sys.exit(1)
+    print('All required indexes are present.')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,7 @@
+import argparse
+import uuid
+from itertools import islice
+
 import data.db_connect as dbc
 import data.people as ppl
 import data.manuscripts.query as qy
@@ -14,25 +18,130 @@ HISTORY = 'history'
 EDITOR_EMAIL = 'editor_email'
 MANUSCRIPTS_COLLECT = 'manuscripts'
 ACTION = 'action'
-def read() -> dict:
+
+# Bodies (text and abstract) live in their own collection, keyed on the
+# manuscript's id, so state changes and listings never drag them along.
+BODIES_COLLECT = 'manuscript_bodies'
+MANU_ID = 'manu_id'
+BODY_FIELDS = [TEXT, ABSTRACT]
+
+# Manuscripts change state often, so their cache entries live briefly.
+CACHE_TTL = 10
+dbc.cache_reads(MANUSCRIPTS_COLLECT, CACHE_TTL)
+dbc.cache_reads(BODIES_COLLECT, CACHE_TTL)
+# Listings are tagged with the collection's version (see get_version()).
+dbc.track_versions(MANUSCRIPTS_COLLECT)
+
+# projections:
+EXISTS_FIELDS = {TITLE: 1}
+STATE_FIELDS = {TITLE: 1, STATE: 1}
+NO_BODY = {TEXT: 0, ABSTRACT: 0}
+BODY_PROJECTION = {MANU_ID: 1, TEXT: 1, ABSTRACT: 1, dbc.MONGO_ID: 0}
+# Reads only load bodies when asked for whole manuscripts,
+# i.e. when no projection is passed.
+
+
+def split_body(manuscript: dict) -> dict:
+    """
+    Pop the body fields out of manuscript and return them.
+    """
+    return {fld: manuscript.pop(fld) for fld in BODY_FIELDS
+            if fld in manuscript}
+
+
+def read_body(manu_id) -> dict:
+    body = dbc.fetch_one(BODIES_COLLECT, {MANU_ID: str(manu_id)},
+                         projection=BODY_PROJECTION)
+    if body:
+        del body[MANU_ID]
+    return body or {}
+
+
+def attach_bodies(manus: list, keep_id: bool = False) -> list:
+    """
+    Load the bodies for a batch of manuscripts in one query.
+    Manuscripts stored before the split still carry their body inline;
+    those are left as they are.
+    """
+    ids = [str(manu[dbc.MONGO_ID]) for manu in manus]
+    bodies = {}
+    for body in dbc.read_iter(BODIES_COLLECT, filt={MANU_ID: {'$in': ids}},
+                              projection=BODY_PROJECTION):
+        bodies[body.pop(MANU_ID)] = body
+    for manu_id, manu in zip(ids, manus):
+        manu.update(bodies.get(manu_id, {}))
+        if not keep_id:
+            del manu[dbc.MONGO_ID]
+    return manus
+
+
+def read(projection: dict = None) -> dict:
     """
     return all the manuscripts
     """
-    manuscripts = dbc.read_dict(MANUSCRIPTS_COLLECT, TITLE)
+    manuscripts = dict(read_iter(projection=projection))
     return manuscripts
 
 
-def read_one(title: str) -> dict:
+def read_iter(batch_size: int = dbc.DEFAULT_BATCH_SIZE,
+              projection: dict = None):
+    """
+    Stream (title, manuscript) pairs straight off the DB cursor.
+    Full reads fetch bodies one batch at a time.
+    """
+    if projection is not None:
+        yield from dbc.read_dict_iter(MANUSCRIPTS_COLLECT, TITLE,
+                                      projection=projection,
+                                      batch_size=batch_size)
+        return
+    manus = dbc.read_iter(MANUSCRIPTS_COLLECT, no_id=False,
+                          batch_size=batch_size)
+    while True:
+        batch = list(islice(manus, batch_size))
+        if not batch:
+            return
+        for manu in attach_bodies(batch):
+            yield manu[TITLE], manu
+
+
+def read_page(limit: int, after: str = None,
+              projection: dict = None) -> tuple:
+    """
+    One page of manuscripts keyed on title, in title order.
+    Returns (manuscripts, next_after); next_after is None on the last page.
+    """
+    dbc.ensure_index(MANUSCRIPTS_COLLECT, TITLE, unique=True)
+    manus, next_after = dbc.read_page(MANUSCRIPTS_COLLECT, TITLE, limit,
+                                      after=after, projection=projection,
+                                      no_id=projection is not None)
+    if projection is None:
+        attach_bodies(manus)
+    return {manu[TITLE]: manu for manu in manus}, next_after
+
+
+def read_one(title: str, projection: dict = None) -> dict:
     """
     return a specific manuscript
     """
-    return dbc.read_one(MANUSCRIPTS_COLLECT, {TITLE: title})
+    manuscript = dbc.read_one(MANUSCRIPTS_COLLECT, {TITLE: title},
+                              projection=projection)
+    if manuscript and projection is None:
+        manuscript.update(read_body(manuscript[dbc.MONGO_ID]))
+    return manuscript
+
+
+def get_version() -> int:
+    """
+    Goes up on every write to the manuscripts collection.
+    """
+    return dbc.get_version(MANUSCRIPTS_COLLECT)
+
 
 def exists(title: str) -> bool:
     """
     Check if a manuscript exist
     """
-    return read_one(title) is not None
+    return read_one(title, projection=EXISTS_FIELDS) is not None
 
 def is_valid_manuscript(title: str, author: str,
                         author_email: str, text: str,
@@ -68,15 +177,21 @@ def create(title: str, author: str, author_email: str,
             HISTORY: [qy.SUBMITTED],
             EDITOR_EMAIL: editor_email,
         }
-        dbc.create(MANUSCRIPTS_COLLECT, manuscript)
+        body = split_body(manuscript)
+        ret = dbc.create(MANUSCRIPTS_COLLECT, manuscript)
+        body[MANU_ID] = str(ret.inserted_id)
+        dbc.create(BODIES_COLLECT, body)
         return title
 
 def update(title: str, updates: dict) -> dict:
+    """
+    Update a manuscript and return the fresh record.
+    Each store takes one atomic update-and-fetch: one round trip for
+    metadata-only updates, two when the body changes too. The body
+    fields are only in the returned record if they were updated.
+    """
     if not title.strip():
         raise ValueError("Title cannot be blank")
-    manuscript = read_one(title)
-    if not manuscript:
-        raise ValueError(f"Manuscript with title '{title}' does not exist.")
     if TITLE in updates:
         del updates[TITLE]
     if AUTHOR_EMAIL in updates:
@@ -91,34 +206,202 @@ def update(title: str, updates: dict) -> dict:
         elif not updates[EDITOR_EMAIL]:
             del updates[EDITOR_EMAIL]
 
-    dbc.update_doc(MANUSCRIPTS_COLLECT, {TITLE: title}, updates)
-    return read_one(title)
+    body_updates = split_body(updates)
+    if updates:
+        manuscript = dbc.update_and_fetch(MANUSCRIPTS_COLLECT,
+                                          {TITLE: title}, updates)
+    else:
+        manuscript = read_one(title, projection=NO_BODY)
+    if not manuscript:
+        raise ValueError(f"Manuscript with title '{title}' does not exist.")
+    if body_updates:
+        body = dbc.update_and_fetch(BODIES_COLLECT,
+                                    {MANU_ID: str(manuscript[dbc.MONGO_ID])},
+                                    body_updates, upsert=True,
+                                    projection=BODY_PROJECTION)
+        del body[MANU_ID]
+        manuscript.update(body)
+    return manuscript
 
 
 def delete(title: str) -> bool:
     if not title.strip():
         raise ValueError("Title cannot be blank")
-    manuscript = read_one(title)
+    manuscript = read_one(title, projection=EXISTS_FIELDS)
     if not manuscript:
         raise ValueError(f"Manuscript with title '{title}' does not exist.")
 
     dbc.delete(MANUSCRIPTS_COLLECT, {TITLE: title})
+    dbc.delete(BODIES_COLLECT, {MANU_ID: str(manuscript[dbc.MONGO_ID])})
     return True
+
+
+MAX_STATE_RETRIES = 3
+
+
 def update_state(title: str, action: str, **kwargs):
-    manuscript = read_one(title)
-    current_state = manuscript[STATE]
-    # Determine the new state using handle_action
-    new_state = qy.handle_action(
-        current_state, action, title=title, **kwargs
-    )
-    # Update the manuscript state and history in the database
-    dbc.update_doc(
-        MANUSCRIPTS_COLLECT,
-        {TITLE: title},
-        {
-            STATE: new_state,
-            HISTORY: manuscript[HISTORY] + [new_state],
-        },
-    )
-    return title
+    """
+    Compare-and-set: the new state is written with one conditional
+    update that only matches if the state is still the one we read,
+    and the history entry is pushed server-side, so concurrent actions
+    can't lose each other's history.
+    If someone else moved the manuscript first, re-read and retry.
+    """
+    for _attempt in range(MAX_STATE_RETRIES):
+        manuscript = read_one(title, projection={STATE: 1})
+        if not manuscript:
+            raise ValueError(
+                f"Manuscript with title '{title}' does not exist."
+            )
+        current_state = manuscript[STATE]
+        # Determine the new state using handle_action
+        new_state = qy.handle_action(
+            current_state, action, title=title, **kwargs
+        )
+        result = dbc.modify_doc(
+            MANUSCRIPTS_COLLECT,
+            {TITLE: title, STATE: current_state},
+            {'$set': {STATE: new_state}, '$push': {HISTORY: new_state}},
+        )
+        if result.matched_count:
+            return title
+    raise ValueError(f"Manuscript '{title}' kept changing state; "
+                     + f"{action} not applied.")
+
+
+# bulk results:
+KWARGS = 'kwargs'
+OK = 'ok'
+NEW_STATE = 'new_state'
+ERROR = 'error'
+RESULTS = 'results'
+CONFLICTS = 'conflicts'
+# each bulk write pushes a token here, so we can tell which landed:
+BULK_OPS = 'bulk_ops'
+
+
+def bulk_update_state(items: list) -> dict:
+    """
+    Apply many (title, action, kwargs) transitions at once.
+    One read fetches the current state of every manuscript involved;
+    each action is validated in memory against the state table; all the
+    valid ones go to the DB in one ordered bulk write. Each write is a
+    compare-and-set on the state (and, for referee actions, the referee
+    list) we validated against, chained so the same manuscript can
+    appear more than once.
+    Each write also pushes a unique token. If some writes lost a race,
+    we re-read the tokens to find which, and mark those items as failed.
+    The tokens are pulled again once we are done.
+    Returns per-item results plus a count of writes that lost a race.
+    """
+    titles = list({item.get(TITLE) for item in items
+                   if isinstance(item.get(TITLE), str)})
+    manus = {manu[TITLE]: manu
+             for manu in dbc.read(MANUSCRIPTS_COLLECT,
+                                  filt={TITLE: {'$in': titles}},
+                                  projection={TITLE: 1, STATE: 1,
+                                              REFEREES: 1})}
+    results = []
+    updates = []
+    written = {}
+    for item in items:
+        title = item.get(TITLE)
+        action = item.get(ACTION)
+        result = {TITLE: title, ACTION: action, OK: False}
+        results.append(result)
+        if not isinstance(title, str) or not isinstance(action, str):
+            result[ERROR] = f'{TITLE} and {ACTION} must be strings.'
+            continue
+        if title not in manus:
+            result[ERROR] = f"Manuscript with title '{title}' does not exist."
+            continue
+        manu = manus[title]
+        old_refs = list(manu.get(REFEREES, []))
+        try:
+            kwargs = {**item.get(KWARGS, {}), 'manu': manu}
+            new_state = qy.handle_action(manu[STATE], action, **kwargs)
+        except (ValueError, KeyError, TypeError) as err:
+            manu[REFEREES] = old_refs
+            result[ERROR] = f'Bad action: {err}'
+            continue
+        filt = {TITLE: title, STATE: manu[STATE]}
+        new_fields = {STATE: new_state}
+        # Referee actions change manu's list in memory: save that in
+        # the same compare-and-set.
+        if manu.get(REFEREES, []) != old_refs:
+            filt[REFEREES] = old_refs
+            new_fields[REFEREES] = list(manu[REFEREES])
+        op = uuid.uuid4().hex
+        updates.append((
+            filt,
+            {'$set': new_fields,
+             '$push': {HISTORY: new_state, BULK_OPS: op}},
+        ))
+        manu[STATE] = new_state
+        result[OK] = True
+        result[NEW_STATE] = new_state
+        written.setdefault(title, []).append((op, result))
+    counts = dbc.bulk_update(MANUSCRIPTS_COLLECT, updates)
+    conflicts = len(updates) - counts[dbc.MATCHED]
+    if conflicts:
+        mark_lost_races(written)
+    dbc.bulk_update(MANUSCRIPTS_COLLECT, [
+        ({TITLE: title}, {'$pull': {BULK_OPS: {'$in': [op for op, _ in ops]}}})
+        for title, ops in written.items()
+    ])
+    return {
+        RESULTS: results,
+        CONFLICTS: conflicts,
+    }
+
+
+def mark_lost_races(written: dict):
+    """
+    written maps each title to the (op token, result) of its writes.
+    A write landed if its token made it into the doc; the rest lost a
+    race and are marked as failed.
+    """
+    landed = set()
+    for manu in dbc.read(MANUSCRIPTS_COLLECT,
+                         filt={TITLE: {'$in': list(written)}},
+                         projection={BULK_OPS: 1}):
+        landed.update(manu.get(BULK_OPS, []))
+    for title, ops in written.items():
+        for op, result in ops:
+            if op in landed:
+                continue
+            result[OK] = False
+            del result[NEW_STATE]
+            result[ERROR] = (f"Manuscript '{title}' changed state "
+                             'before this action was saved.')
+
+
+def split_stored_bodies() -> int:
+    """
+    Move bodies still stored inline (from before the split) into the
+    body store. Safe to re-run. Returns how many were moved.
+    """
+    moved = 0
+    inline = dbc.read_iter(MANUSCRIPTS_COLLECT, no_id=False,
+                           filt={TEXT: {'$exists': True}},
+                           projection={fld: 1 for fld in BODY_FIELDS})
+    for manu in inline:
+        mongo_id = manu.pop(dbc.MONGO_ID)
+        dbc.modify_doc(BODIES_COLLECT, {MANU_ID: str(mongo_id)},
+                       {'$set': manu}, upsert=True)
+        dbc.modify_doc(MANUSCRIPTS_COLLECT, {dbc.MONGO_ID: mongo_id},
+                       {'$unset': {fld: '' for fld in BODY_FIELDS}})
+        moved += 1
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manuscript data commands.')
+    parser.add_argument('command', choices=['split-bodies'])
+    args = parser.parse_args()
+    if args.command == 'split-bodies':
+        print(f'Moved {split_stored_bodies()} bodies.')
+
 
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,5 @@
+import inspect
+
 import data.manuscripts.fields as flds
 # states:
 AUTHOR_REV = 'AUR'
@@ -165,18 +167,97 @@ STATE_TABLE = {
 }
 
 
-def get_valid_actions_by_state(state: str):
-    valid_actions = STATE_TABLE[state].keys()
-    print(f'{valid_actions=}')
-    return valid_actions
+# STATE_TABLE compiled at import into a dense state x action matrix of
+# integer codes. Cells hold the next state's code, NO_TRANSITION, or
+# DYNAMIC when the next state depends on the manuscript (e.g. delete_ref).
+STATE_CODES = {state: code for code, state in enumerate(VALID_STATES)}
+ACTION_CODES = {action: code for code, action in enumerate(VALID_ACTIONS)}
+NO_TRANSITION = -1
+DYNAMIC = -2
 
 
-def handle_action(curr_state, action, **kwargs) -> str:
-    if curr_state not in STATE_TABLE:
+def is_static(func) -> bool:
+    """
+    A transition whose function takes nothing but **kwargs always
+    lands in the same state, so we can evaluate it once up front.
+    """
+    params = inspect.signature(func).parameters.values()
+    return all(param.kind == param.VAR_KEYWORD for param in params)
+
+
+def compile_state_table(state_table: dict) -> tuple:
+    """
+    Returns (transitions, valid_actions): the matrix as a tuple of
+    tuples, and a dict of state -> tuple of its valid actions.
+    """
+    transitions = []
+    valid_actions = {}
+    for state in VALID_STATES:
+        row = [NO_TRANSITION] * len(VALID_ACTIONS)
+        for action, transition in state_table.get(state, {}).items():
+            if is_static(transition[FUNC]):
+                row[ACTION_CODES[action]] = STATE_CODES[transition[FUNC]()]
+            else:
+                row[ACTION_CODES[action]] = DYNAMIC
+        transitions.append(tuple(row))
+        valid_actions[state] = tuple(state_table.get(state, {}))
+    return tuple(transitions), valid_actions
+
+
+TRANSITIONS, VALID_ACTIONS_BY_STATE = compile_state_table(STATE_TABLE)
+
+
+def get_valid_actions_by_state(state: str) -> tuple:
+    return VALID_ACTIONS_BY_STATE[state]
+
+
+def next_state_code(curr_state, action) -> int:
+    if curr_state not in STATE_CODES:
         raise ValueError(f'Bad state: {curr_state}')
-    if action not in STATE_TABLE[curr_state]:
+    next_code = NO_TRANSITION
+    if action in ACTION_CODES:
+        next_code = TRANSITIONS[STATE_CODES[curr_state]][ACTION_CODES[action]]
+    if next_code == NO_TRANSITION:
         raise ValueError(f'{action} not available in {curr_state}')
-    return STATE_TABLE[curr_state][action][FUNC](**kwargs)
+    return next_code
+
+
+def handle_action(curr_state, action, **kwargs) -> str:
+    next_code = next_state_code(curr_state, action)
+    if next_code == DYNAMIC:
+        return STATE_TABLE[curr_state][action][FUNC](**kwargs)
+    return VALID_STATES[next_code]
+
+
+def handle_actions(states: list, actions: list,
+                   kwargs_list: list = None) -> tuple:
+    """
+    Bulk form of handle_action() over parallel lists of states and
+    actions. Returns (next_states, errors), also parallel: each item
+    has either a next state or the ValueError explaining why not.
+    Transitions that depend on the manuscript need its kwargs in
+    kwargs_list; static ones are pure table lookups.
+    """
+    if len(states) != len(actions):
+        raise ValueError('states and actions must be the same length')
+    next_states = [None] * len(states)
+    errors = [None] * len(states)
+    for i, (curr_state, action) in enumerate(zip(states, actions)):
+        kwargs = kwargs_list[i] if kwargs_list else None
+        try:
+            next_code = next_state_code(curr_state, action)
+            if next_code != DYNAMIC:
+                next_states[i] = VALID_STATES[next_code]
+            elif kwargs is None:
+                raise ValueError(f'{action} in {curr_state} '
+                                 + 'needs the manuscript')
+            else:
+                next_states[i] = handle_action(curr_state, action, **kwargs)
+        except ValueError as err:
+            errors[i] = err
+        except (KeyError, TypeError) as err:
+            errors[i] = ValueError(f'Bad {action} in {curr_state}: {err}')
+    return next_states, errors
 
 def main():
     print(handle_action(SUBMITTED, ASSIGN_REF,
@@ -1,4 +1,6 @@
 import pytest
+from unittest.mock import MagicMock, patch
+import data.db_connect as dbc
 import data.manuscripts.manuscript as mt
 
 TEST_TITLE = "Test Title"
@@ -29,6 +31,44 @@ def test_read():
     mt.delete(TEST_TITLE)
 
 
+def test_read_iter():
+    if mt.exists(TEST_TITLE):
+        mt.delete(TEST_TITLE)
+    mt.create(TEST_TITLE, TEST_AUTHOR, TEST_AUTHOR_EMAIL,
+              TEST_TEXT, TEST_ABSTRACT, TEST_EDITOR_EMAIL)
+    titles = [title for title, manu in mt.read_iter(batch_size=1)]
+    assert TEST_TITLE in titles
+    mt.delete(TEST_TITLE)
+
+
+def test_read_page_full():
+    if mt.exists(TEST_TITLE):
+        mt.delete(TEST_TITLE)
+    mt.create(TEST_TITLE, TEST_AUTHOR, TEST_AUTHOR_EMAIL,
+              TEST_TEXT, TEST_ABSTRACT, TEST_EDITOR_EMAIL)
+    manuscripts = {}
+    after = None
+    while True:
+        page, after = mt.read_page(1, after=after)
+        manuscripts.update(page)
+        if after is None:
+            break
+    assert manuscripts[TEST_TITLE][mt.TEXT] == TEST_TEXT
+    assert dbc.MONGO_ID not in manuscripts[TEST_TITLE]
+    mt.delete(TEST_TITLE)
+
+
+
+def test_read_state_fields():
+    if mt.exists(TEST_TITLE):
+        mt.delete(TEST_TITLE)
+    mt.create(TEST_TITLE, TEST_AUTHOR, TEST_AUTHOR_EMAIL,
+              TEST_TEXT, TEST_ABSTRACT, TEST_EDITOR_EMAIL)
+    manuscript = mt.read(projection=mt.STATE_FIELDS)[TEST_TITLE]
+    assert manuscript[mt.STATE] == 'SUB'
+    assert mt.TEXT not in manuscript
+    mt.delete(TEST_TITLE)
+
 
 def test_read_one():
     if mt.exists(TEST_TITLE):
@@ -104,4 +144,187 @@ def test_update_state():
     updated_manuscript = mt.read_one(TEST_TITLE)
     assert updated_manuscript['state'] == 'REJ'
     assert updated_manuscript['history'] == ['SUB', 'REJ']
-    mt.delete(TEST_TITLE)
\ No newline at end of file
+    mt.delete(TEST_TITLE)
+
+def test_body_stored_separately():
+    if mt.exists(TEST_TITLE):
+        mt.delete(TEST_TITLE)
+    mt.create(TEST_TITLE, TEST_AUTHOR, TEST_AUTHOR_EMAIL,
+              TEST_TEXT, TEST_ABSTRACT, TEST_EDITOR_EMAIL)
+    meta = mt.read_one(TEST_TITLE, projection=mt.NO_BODY)
+    assert mt.TEXT not in meta
+    raw = dbc.read_one(mt.MANUSCRIPTS_COLLECT, {mt.TITLE: TEST_TITLE})
+    assert mt.TEXT not in raw
+    assert mt.read_body(meta[dbc.MONGO_ID])[mt.TEXT] == TEST_TEXT
+    manuscript = mt.read_one(TEST_TITLE)
+    assert manuscript[mt.TEXT] == TEST_TEXT
+    assert manuscript[mt.ABSTRACT] == TEST_ABSTRACT
+    assert mt.read()[TEST_TITLE][mt.TEXT] == TEST_TEXT
+    mt.delete(TEST_TITLE)
+    assert mt.read_body(meta[dbc.MONGO_ID]) == {}
+
+
+def test_split_stored_bodies():
+    if mt.exists(TEST_TITLE):
+        mt.delete(TEST_TITLE)
+    dbc.create(mt.MANUSCRIPTS_COLLECT, {mt.TITLE: TEST_TITLE,
+                                        mt.TEXT: TEST_TEXT,
+                                        mt.ABSTRACT: TEST_ABSTRACT})
+    assert mt.read_one(TEST_TITLE)[mt.TEXT] == TEST_TEXT
+    assert mt.split_stored_bodies() >= 1
+    raw = dbc.read_one(mt.MANUSCRIPTS_COLLECT, {mt.TITLE: TEST_TITLE})
+    assert mt.TEXT not in raw
+    assert mt.read_one(TEST_TITLE)[mt.TEXT] == TEST_TEXT
+    mt.delete(TEST_TITLE)
+
+
+def test_update_state_retries_on_conflict():
+    if mt.exists(TEST_TITLE):
+        mt.delete(TEST_TITLE)
+    mt.create(TEST_TITLE, TEST_AUTHOR, TEST_AUTHOR_EMAIL,
+              TEST_TEXT, TEST_ABSTRACT, TEST_EDITOR_EMAIL)
+    real_handle_action = mt.qy.handle_action
+    calls = []
+
+    def racing_handle_action(curr_state, action, **kwargs):
+        calls.append(curr_state)
+        if len(calls) == 1:
+            # another editor moves the manuscript under us:
+            dbc.modify_doc(mt.MANUSCRIPTS_COLLECT, {mt.TITLE: TEST_TITLE},
+                           {'$set': {mt.STATE: 'REV'},
+                            '$push': {mt.HISTORY: 'REV'}})
+        return real_handle_action(curr_state, action, **kwargs)
+
+    with patch.object(mt.qy, 'handle_action',
+                      side_effect=racing_handle_action):
+        mt.update_state(TEST_TITLE, 'REJ')
+    updated = mt.read_one(TEST_TITLE)
+    assert updated['state'] == 'REJ'
+    assert updated['history'] == ['SUB', 'REV', 'REJ']
+    mt.delete(TEST_TITLE)
+
+
+def test_update_state_gives_up():
+    if mt.exists(TEST_TITLE):
+        mt.delete(TEST_TITLE)
+    mt.create(TEST_TITLE, TEST_AUTHOR, TEST_AUTHOR_EMAIL,
+              TEST_TEXT, TEST_ABSTRACT, TEST_EDITOR_EMAIL)
+    with patch.object(mt.dbc, 'modify_doc',
+                      return_value=MagicMock(matched_count=0)):
+        with pytest.raises(ValueError):
+            mt.update_state(TEST_TITLE, 'REJ')
+    mt.delete(TEST_TITLE)
+
+
+def test_update_state_missing():
+    with pytest.raises(ValueError):
+        mt.update_state('Not a real title', 'REJ')
+
+
+BULK_TITLES = ['Bulk Title 1', 'Bulk Title 2']
+
+
+@pytest.fixture
+def bulk_manuscripts():
+    for title in BULK_TITLES:
+        if mt.exists(title):
+            mt.delete(title)
+        mt.create(title, TEST_AUTHOR, TEST_AUTHOR_EMAIL,
+                  TEST_TEXT, TEST_ABSTRACT, TEST_EDITOR_EMAIL)
+    yield BULK_TITLES
+    for title in BULK_TITLES:
+        mt.delete(title)
+
+
+def test_bulk_update_state(bulk_manuscripts):
+    first, second = bulk_manuscripts
+    ret = mt.bulk_update_state([
+        {mt.TITLE: first, mt.ACTION: 'ARF', mt.KWARGS: {'ref': 'Jack'}},
+        {mt.TITLE: first, mt.ACTION: 'ACC'},
+        {mt.TITLE: second, mt.ACTION: 'DON'},
+        {mt.TITLE: 'No such title', mt.ACTION: 'REJ'},
+        {mt.TITLE: second, mt.ACTION: 'REJ'},
+    ])
+    results = ret[mt.RESULTS]
+    assert [result[mt.OK] for result in results] \
+        == [True, True, False, False, True]
+    assert results[1][mt.NEW_STATE] == 'CED'
+    assert mt.ERROR in results[2]
+    assert ret[mt.CONFLICTS] == 0
+    assert mt.read_one(first)[mt.HISTORY] == ['SUB', 'REV', 'CED']
+    assert mt.read_one(first)[mt.REFEREES] == ['Jack']
+    assert mt.read_one(second)[mt.STATE] == 'REJ'
+
+
+def test_bulk_update_state_not_strings():
+    ret = mt.bulk_update_state([
+        {mt.TITLE: {'$ne': None}, mt.ACTION: 'REJ'},
+        {mt.TITLE: ['a', 'b'], mt.ACTION: 'REJ'},
+        {mt.TITLE: 'Some title', mt.ACTION: ['REJ']},
+    ])
+    for result in ret[mt.RESULTS]:
+        assert not result[mt.OK]
+        assert mt.ERROR in result
+    assert ret[mt.CONFLICTS] == 0
+
+
+def test_bulk_update_state_referees(bulk_manuscripts):
+    first, _second = bulk_manuscripts
+    ret = mt.bulk_update_state([
+        {mt.TITLE: first, mt.ACTION: 'ARF', mt.KWARGS: {'ref': 'Jack'}},
+        {mt.TITLE: first, mt.ACTION: 'ARF', mt.KWARGS: {'ref': 'Jill'}},
+        {mt.TITLE: first, mt.ACTION: 'DRF', mt.KWARGS: {'ref': 'Jack'}},
+        {mt.TITLE: first, mt.ACTION: 'DRF', mt.KWARGS: {'ref': 'Nobody'}},
+    ])
+    assert [result[mt.OK] for result in ret[mt.RESULTS]] \
+        == [True, True, True, False]
+    assert ret[mt.CONFLICTS] == 0
+    manu = mt.read_one(first)
+    assert manu[mt.STATE] == 'REV'
+    assert manu[mt.REFEREES] == ['Jill']
+
+
+def test_bulk_update_state_lost_race(bulk_manuscripts):
+    first, second = bulk_manuscripts
+    real_bulk_update = mt.dbc.bulk_update
+
+    def racing_bulk_update(collection, updates, **kwargs):
+        if racer:
+            # another editor rejects the manuscript under us:
+            dbc.modify_doc(mt.MANUSCRIPTS_COLLECT, {mt.TITLE: racer.pop()},
+                           {'$set': {mt.STATE: 'REJ'},
+                            '$push': {mt.HISTORY: 'REJ'}})
+        return real_bulk_update(collection, updates, **kwargs)
+
+    racer = [first]
+
+    with patch.object(mt.dbc, 'bulk_update', side_effect=racing_bulk_update):
+        ret = mt.bulk_update_state([
+            {mt.TITLE: first, mt.ACTION: 'ARF', mt.KWARGS: {'ref': 'Jack'}},
+            {mt.TITLE: first, mt.ACTION: 'ACC'},
+            {mt.TITLE: second, mt.ACTION: 'REJ'},
+        ])
+    results = ret[mt.RESULTS]
+    assert [result[mt.OK] for result in results] == [False, False, True]
+    assert mt.ERROR in results[0]
+    assert mt.NEW_STATE not in results[1]
+    assert ret[mt.CONFLICTS] == 2
+    assert mt.read_one(first)[mt.STATE] == 'REJ'
+    # the tokens don't outlive the call:
+    assert not mt.read_one(second).get(mt.BULK_OPS)
+
+    # the other editor reaching our target state first is still a loss:
+    mt.delete(second)
+    mt.create(second, TEST_AUTHOR, TEST_AUTHOR_EMAIL,
+              TEST_TEXT, TEST_ABSTRACT, TEST_EDITOR_EMAIL)
+    racer = [second]
+    with patch.object(mt.dbc, 'bulk_update', side_effect=racing_bulk_update):
+        ret = mt.bulk_update_state([{mt.TITLE: second, mt.ACTION: 'REJ'}])
+    assert ret[mt.RESULTS][0][mt.OK] is False
+    assert ret[mt.CONFLICTS] == 1
+    assert mt.read_one(second)[mt.HISTORY] == ['SUB', 'REJ']
+
+
+def test_update_not_there():
+    with pytest.raises(ValueError):
+        mt.update('Not a real title', {mt.AUTHOR: 'Nobody'})
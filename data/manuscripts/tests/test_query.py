@@ -47,4 +47,53 @@ def test_handle_action_valid_return():
                                            manu=mqry.SAMPLE_MANU,
                                            ref='Some ref')
             print(f'{new_state=}')
-            assert mqry.is_valid_state(new_state)
\ No newline at end of file
+            assert mqry.is_valid_state(new_state)
+
+def test_transitions_match_state_table():
+    for state in mqry.get_states():
+        for action in mqry.get_actions():
+            code = mqry.TRANSITIONS[mqry.STATE_CODES[state]][
+                mqry.ACTION_CODES[action]]
+            if action not in mqry.STATE_TABLE[state]:
+                assert code == mqry.NO_TRANSITION
+                continue
+            func = mqry.STATE_TABLE[state][action][mqry.FUNC]
+            if mqry.is_static(func):
+                assert mqry.VALID_STATES[code] == func()
+            else:
+                assert code == mqry.DYNAMIC
+
+
+def test_valid_actions_by_state_match_state_table():
+    for state in mqry.get_states():
+        assert mqry.get_valid_actions_by_state(state) \
+            == tuple(mqry.STATE_TABLE[state].keys())
+
+
+def test_handle_actions():
+    states = [mqry.SUBMITTED, mqry.SUBMITTED, mqry.PUBLISHED, 'bad state',
+              mqry.IN_REF_REV]
+    actions = [mqry.REJECT, mqry.ACCEPT, mqry.WITHDRAW, mqry.REJECT,
+               mqry.DELETE_REF]
+    next_states, errors = mqry.handle_actions(states, actions)
+    assert next_states[0] == mqry.REJECTED
+    assert next_states[1] is None
+    assert isinstance(errors[1], ValueError)
+    assert next_states[2] == mqry.WITHDRAWN
+    assert isinstance(errors[3], ValueError)
+    # delete_ref depends on the manuscript, which we didn't pass:
+    assert isinstance(errors[4], ValueError)
+
+
+def test_handle_actions_dynamic():
+    manu = {'title': 'T', 'referees': ['Jack']}
+    next_states, errors = mqry.handle_actions(
+        [mqry.IN_REF_REV], [mqry.DELETE_REF],
+        [{'manu': manu, 'ref': 'Jack'}])
+    assert next_states == [mqry.SUBMITTED]
+    assert errors == [None]
+
+
+def test_handle_actions_length_mismatch():
+    with pytest.raises(ValueError):
+        mqry.handle_actions([mqry.SUBMITTED], [])
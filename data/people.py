@@ -2,6 +2,7 @@
 This module interfaces to our user data.
 """
 
+import argparse
 import re
 
 import data.db_connect as dbc
@@ -13,6 +14,12 @@ from werkzeug.security import generate_password_hash, check_password_hash
 PEOPLE_COLLECT = 'people'
 USER_COLLECT = 'users'
 
+# Single person and user lookups may be served from cache this long
+# (seconds). Writes from this process invalidate the cache at once.
+CACHE_TTL = 30
+dbc.cache_reads(PEOPLE_COLLECT, CACHE_TTL)
+dbc.cache_reads(USER_COLLECT, CACHE_TTL)
+
 MIN_USER_NAME_LEN = 2
 
 # fields
@@ -39,9 +46,6 @@ people_dict = {
     },
 }
 
-client = dbc.connect_db()
-print(f'{client=}')
-
 first_part = (
     r"[a-zA-Z0-9]"
     r"(?:[a-zA-Z0-9!#$%&'*+/=?^_{|}~.-]*[a-zA-Z0-9])"
@@ -88,23 +92,46 @@ def read() -> dict:
         - Returns a dictionary of users keyed on user email.
         - Each user email must be the key for another dictionary.
     """
-    people = dbc.read_dict(PEOPLE_COLLECT, EMAIL)
+    people = dict(read_iter())
     if not people:
         print("There is no people in the mongodb")
-    print(f'{people=}')
     return people
 
 
-def read_one(email: str) -> dict:
+def read_iter(batch_size: int = dbc.DEFAULT_BATCH_SIZE):
+    """
+    Stream (email, person) pairs straight off the DB cursor.
+    """
+    return dbc.read_dict_iter(PEOPLE_COLLECT, EMAIL, batch_size=batch_size)
+
+
+def read_page(limit: int, after: str = None) -> tuple:
+    """
+    One page of people keyed on email, in email order.
+    Returns (people, next_after); pass next_after back to get the
+    following page. It is None on the last page.
+    """
+    dbc.ensure_index(PEOPLE_COLLECT, EMAIL, unique=True)
+    people, next_after = dbc.read_page(PEOPLE_COLLECT, EMAIL, limit,
+                                       after=after)
+    return {person[EMAIL]: person for person in people}, next_after
+
+
+def read_one(email: str, projection: dict = None) -> dict:
     """
     Return a person record if email present in DB,
     else None.
     """
-    return dbc.read_one(PEOPLE_COLLECT, {EMAIL: email})
+    return dbc.read_one(PEOPLE_COLLECT, {EMAIL: email},
+                        projection=projection)
+
+
+EXISTS_PROJECTION = {EMAIL: 1}
+ROLES_PROJECTION = {ROLES: 1}
 
 
 def exists(email: str) -> bool:
-    return read_one(email) is not None
+    return read_one(email, projection=EXISTS_PROJECTION) is not None
 
 
 def delete_person(email: str):
@@ -112,12 +139,15 @@ def delete_person(email: str):
     Delete a person from MongoDB by email.
     If the person does not exist, print a message and return None.
     """
-    person = dbc.fetch_one(PEOPLE_COLLECT, {"email": email})
+    person = dbc.fetch_one(PEOPLE_COLLECT, {"email": email},
+                           projection=ROLES_PROJECTION)
     if person is None:
         print(f'No person found with {email=}')
         return None
     result = dbc.delete(PEOPLE_COLLECT, {"email": email})
     print(result)
+    if get_mh_role_codes(person.get(ROLES)):
+        remove_from_masthead(email)
     print(f"Deleted {email=}")
     return email
 
@@ -128,9 +158,6 @@ def create_person(name: str,
                   role: str = None,
                   roles: list = None):
 
-    if exists(email):
-        raise ValueError(f'Adding duplicate {email=}')
-
     # Normalize into a list
     if roles is not None:
         # validate each role in the list
@@ -148,7 +175,9 @@ def create_person(name: str,
         ROLES: roles_list
     }
     print("Creating person:", person)
-    dbc.create(PEOPLE_COLLECT, person)
+    if not dbc.insert_if_absent(PEOPLE_COLLECT, {EMAIL: email}, person):
+        raise ValueError(f'Adding duplicate {email=}')
+    add_to_masthead(person)
     return email
 
 
@@ -173,15 +202,160 @@ def create_mh_rec(person: dict) -> dict:
     return mh_rec
 
 
+def get_mh_projection() -> dict:
+    projection = {EMAIL: 1, ROLES: 1}
+    for field in get_mh_fields():
+        projection[field] = 1
+    return projection
+
+
+def get_mh_role_codes(roles) -> list:
+    """
+    Return the masthead role codes found in a roles field.
+    Roles may be stored as a list or, from older writes, a bare string.
+    """
+    if not roles:
+        return []
+    if isinstance(roles, str):
+        roles = [roles]
+    return [role for role in roles if role in rls.MH_ROLES]
+
+
+def read_mh_people() -> list:
+    """
+    One query for the people holding a masthead role, projected down
+    to the fields the masthead needs.
+    """
+    return dbc.read(PEOPLE_COLLECT,
+                    filt={ROLES: {'$in': rls.MH_ROLES}},
+                    projection=get_mh_projection())
+
+
 def get_masthead():
-    masthead = {}
+    """
+    Build the masthead with a single query that only pulls people
+    holding a masthead role, and only the fields the masthead shows.
+    Returns a dict keyed on role text, each holding a dict of
+    masthead records keyed on email.
+    """
     mh_roles = rls.get_masthead_roles()
-    for mh_role, text in mh_roles.items():
-        people_w_role = {}
-        for person_email, person_data in read().items():
-            if has_arole(person_data, mh_role):
-                people_w_role[person_email] = person_data
-        masthead[text] = people_w_role
+    masthead = {text: {} for text in mh_roles.values()}
+    for person in read_mh_people():
+        for role in get_mh_role_codes(person.get(ROLES)):
+            masthead[mh_roles[role]][person[EMAIL]] = create_mh_rec(person)
+    return masthead
+
+
+# The materialized masthead lives in its own collection as one doc:
+#
+# {
+#     key: 'masthead',
+#     version: 12,
+#     CE: [{email: ..., name: ..., affiliation: ...}, ...],
+#     ED: [...],
+#     ME: [...],
+# }
+#
+# create_person(), update_person() and delete_person() patch it in place,
+# so serving the masthead is a single-doc read.
+MASTHEAD_COLLECT = 'masthead'
+MH_KEY = 'key'
+MH_DOC_KEY = 'masthead'
+MH_VERSION = 'version'
+MH_FILTER = {MH_KEY: MH_DOC_KEY}
+MAX_MH_RETRIES = 5
+dbc.cache_reads(MASTHEAD_COLLECT, CACHE_TTL)
+
+
+def create_mh_entry(person: dict) -> dict:
+    mh_entry = create_mh_rec(person)
+    mh_entry[EMAIL] = person[EMAIL]
+    return mh_entry
+
+
+def rebuild_masthead() -> dict:
+    """
+    Recompute the materialized masthead from the people collection.
+    Use this for recovery if the stored doc ever drifts.
+    """
+    entries = {role: [] for role in rls.MH_ROLES}
+    for person in read_mh_people():
+        for role in get_mh_role_codes(person.get(ROLES)):
+            entries[role].append(create_mh_entry(person))
+    dbc.modify_doc(MASTHEAD_COLLECT, MH_FILTER,
+                   {'$set': entries, '$inc': {MH_VERSION: 1}},
+                   upsert=True)
+    return dbc.fetch_one(MASTHEAD_COLLECT, MH_FILTER)
+
+
+def remove_from_masthead(email: str):
+    pulls = {role: {EMAIL: email} for role in rls.MH_ROLES}
+    dbc.modify_doc(MASTHEAD_COLLECT, MH_FILTER,
+                   {'$pull': pulls, '$inc': {MH_VERSION: 1}})
+
+
+def add_to_masthead(person: dict):
+    """
+    Only patches an existing masthead doc: if it is missing,
+    read_masthead() will rebuild it in full on the next read.
+    Replaces any entries the person already has in one compare-and-set
+    on the doc's version, so overlapping calls never list them twice
+    and readers never see them missing. If we keep losing the race, we
+    drop the doc and let the next read rebuild it.
+    """
+    roles = get_mh_role_codes(person.get(ROLES))
+    if not roles:
+        return
+    email = person[EMAIL]
+    entry = create_mh_entry(person)
+    for _attempt in range(MAX_MH_RETRIES):
+        # Not fetch_one(): a cached doc could be stale.
+        mh_docs = dbc.read(MASTHEAD_COLLECT, filt=MH_FILTER)
+        if not mh_docs:
+            return
+        mh_doc = mh_docs[0]
+        entries = {}
+        for role in rls.MH_ROLES:
+            entries[role] = [mh_entry for mh_entry in mh_doc.get(role, [])
+                             if mh_entry[EMAIL] != email]
+            if role in roles:
+                entries[role].append(entry)
+        result = dbc.modify_doc(
+            MASTHEAD_COLLECT,
+            {**MH_FILTER, MH_VERSION: mh_doc.get(MH_VERSION)},
+            {'$set': entries, '$inc': {MH_VERSION: 1}},
+        )
+        if result.matched_count:
+            return
+    dbc.delete(MASTHEAD_COLLECT, MH_FILTER)
+
+
+def read_masthead_doc() -> dict:
+    mh_doc = dbc.fetch_one(MASTHEAD_COLLECT, MH_FILTER)
+    if mh_doc is None:
+        mh_doc = rebuild_masthead()
+    return mh_doc
+
+
+def get_masthead_tag(mh_doc: dict) -> str:
+    """
+    Identifies this revision of the masthead doc. Includes the doc id,
+    since a rebuilt doc starts counting versions over.
+    """
+    return f'{mh_doc.get(dbc.MONGO_ID)}-{mh_doc.get(MH_VERSION, 0)}'
+
+
+def read_masthead(mh_doc: dict = None) -> dict:
+    """
+    Serve the masthead from the materialized doc.
+    Same shape as get_masthead().
+    """
+    if mh_doc is None:
+        mh_doc = read_masthead_doc()
+    masthead = {}
+    for role, text in rls.get_masthead_roles().items():
+        masthead[text] = {entry[EMAIL]: create_mh_rec(entry)
+                          for entry in mh_doc.get(role, [])}
     return masthead
 
 
@@ -191,34 +365,38 @@ def update_person(name: str, affiliation: str, email: str, roles: list):
     If the person with the given email exists,
     update their name, affiliation, and roles (appending to existing roles).
     """
-    # Fetch the person from MongoDB
-    person = dbc.fetch_one(PEOPLE_COLLECT, {"email": email})
-
-    if person:
-        # Prepare the fields to update
-        update_fields = {
-            NAME: name,
-            AFFILIATION: affiliation,
-            ROLES: roles
-        }
-
-        # Use update_doc to apply the updates
-        dbc.update_doc(PEOPLE_COLLECT, {"email": email}, update_fields)
-
-        # Return the updated document for confirmation
-        return dbc.fetch_one(PEOPLE_COLLECT, {"email": email})
-    else:
+    update_fields = {
+        NAME: name,
+        AFFILIATION: affiliation,
+        ROLES: roles
+    }
+    # One atomic round trip: apply the update and get the old doc back,
+    # which tells us both the fresh record and whether the masthead
+    # needs patching.
+    person = dbc.update_and_fetch(PEOPLE_COLLECT, {EMAIL: email},
+                                  update_fields, return_new=False)
+    if person is None:
         # Raise an error if the person does not exist in MongoDB
         raise ValueError(f'Person with email {email} does not exist')
 
+    updated = {**person, **update_fields}
+    if get_mh_role_codes(roles):
+        # replaces whatever entries they had:
+        add_to_masthead(updated)
+    elif get_mh_role_codes(person.get(ROLES)):
+        remove_from_masthead(email)
+    return updated
+
 
 PASSWORD = 'password'
+USER_ROLE = 'role'
+
+NO_PASSWORD = {PASSWORD: 0}
+# all the user listing endpoints show:
+USER_SUMMARY = {EMAIL: 1, USER_ROLE: 1}
 
 
 def register_user(email: str, password: str, role: str = "author"):
-    existing_user = dbc.read_one(USER_COLLECT, {EMAIL: email})
-    if existing_user:
-        raise ValueError(f'User already exists: {email}')
     if not is_valid_email(email):
         raise ValueError(f'Invalid email: {email}')
     if not password:
@@ -226,19 +404,22 @@ def register_user(email: str, password: str, role: str = "author"):
 
     hashed_pw = generate_password_hash(password)
 
+    # roles are stored lower case so role queries can match exactly:
     user = {
         EMAIL: email,
         PASSWORD: hashed_pw,
-        "role": role
+        USER_ROLE: role.lower()
     }
 
-    dbc.create(USER_COLLECT, user)
+    if not dbc.insert_if_absent(USER_COLLECT, {EMAIL: email}, user):
+        raise ValueError(f'User already exists: {email}')
     print(f'User registered: {email}')
     return email
 
 
 def login_user(email: str, password: str) -> bool:
-    person = dbc.fetch_one(USER_COLLECT, {EMAIL: email})
+    person = dbc.fetch_one(USER_COLLECT, {EMAIL: email},
+                           projection={PASSWORD: 1})
     if person is None:
         return False
     stored_pw = person.get(PASSWORD)
@@ -247,13 +428,44 @@ def login_user(email: str, password: str) -> bool:
     return check_password_hash(stored_pw, password)
 
 
-def get_user_by_email(email: str) -> dict:
+def get_user_by_email(email: str,
+                      projection: dict = NO_PASSWORD) -> dict:
     """
     Fetch a user from the MongoDB 'users' collection by email.
     Returns None if user does not exist.
+    The password hash is left in the DB unless asked for.
     """
-    return dbc.fetch_one(USER_COLLECT, {EMAIL: email})
+    return dbc.fetch_one(USER_COLLECT, {EMAIL: email}, projection=projection)
+
 
+def read_users(projection: dict = NO_PASSWORD) -> dict:
+    return dbc.read_dict(USER_COLLECT, EMAIL, projection=projection)
 
-def read_users() -> dict:
-    return dbc.read_dict(USER_COLLECT, EMAIL)
+
+def read_users_page(limit: int, after: str = None,
+                    roles: list = None) -> tuple:
+    """
+    One page of users in email order, optionally only those whose
+    role is in `roles` (in any case).
+    Returns (users, next_after) like read_page().
+    """
+    dbc.ensure_index(USER_COLLECT, EMAIL, unique=True)
+    filt = None
+    if roles:
+        filt = {USER_ROLE: {'$in': [role.lower() for role in roles]}}
+    users, next_after = dbc.read_page(USER_COLLECT, EMAIL, limit,
+                                      after=after, filt=filt,
+                                      projection=USER_SUMMARY)
+    return {user[EMAIL]: user for user in users}, next_after
+
+
+def main():
+    parser = argparse.ArgumentParser(description='People data commands.')
+    parser.add_argument('command', choices=['rebuild-masthead'])
+    args = parser.parse_args()
+    if args.command == 'rebuild-masthead':
+        print(rebuild_masthead())
+
+
+if __name__ == '__main__':
+    main()
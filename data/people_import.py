@@ -0,0 +1,174 @@
+"""
+This module bulk-imports people from CSV or JSON-lines input.
+Rows are validated and deduped a chunk at a time: one $in query finds
+the emails already present, and one unordered insert_many writes the
+rest. A result for every row is yielded as soon as its chunk is done.
+
+From the command line:
+    python -m data.people_import reviewers.csv
+"""
+import argparse
+import csv
+import json
+import sys
+from itertools import islice
+
+import data.db_connect as dbc
+import data.people as ppl
+
+CSV = 'csv'
+JSON_LINES = 'jsonl'
+FORMATS = [CSV, JSON_LINES]
+
+IMPORT_CHUNK_SIZE = 500
+
+# In CSV, a person's roles share one column:
+ROLE_SEP = ';'
+
+# result fields:
+ROW = 'row'
+STATUS = 'status'
+ERROR = 'error'
+
+# statuses:
+CREATED = 'created'
+DUPLICATE = 'duplicate'
+INVALID = 'invalid'
+FAILED = 'failed'
+
+
+def parse_csv(lines):
+    for rec in csv.DictReader(lines):
+        roles = rec.get(ppl.ROLES) or ''
+        rec[ppl.ROLES] = [role.strip() for role in roles.split(ROLE_SEP)
+                          if role.strip()]
+        yield rec
+
+
+def parse_json_lines(lines):
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as err:
+            yield {ERROR: f'Bad JSON: {err}'}
+
+
+def parse(lines, fmt: str = JSON_LINES):
+    """
+    Turn an iterable of text lines into an iterable of person records.
+    """
+    if fmt == CSV:
+        return parse_csv(lines)
+    if fmt == JSON_LINES:
+        return parse_json_lines(lines)
+    raise ValueError(f'Unknown import format: {fmt}')
+
+
+def to_person(rec) -> dict:
+    """
+    Validate one record and return the person doc to insert.
+    Raises ValueError if the record is no good.
+    """
+    if not isinstance(rec, dict):
+        raise ValueError('Each record must be an object')
+    if ERROR in rec:
+        raise ValueError(rec[ERROR])
+    name = rec.get(ppl.NAME)
+    affiliation = rec.get(ppl.AFFILIATION) or ''
+    email = rec.get(ppl.EMAIL)
+    roles = rec.get(ppl.ROLES) or []
+    if isinstance(roles, str):
+        roles = [roles]
+    if not isinstance(name, str) or len(name) < ppl.MIN_USER_NAME_LEN:
+        raise ValueError(f'Invalid name: {name}')
+    if not isinstance(affiliation, str):
+        raise ValueError(f'Invalid affiliation: {affiliation}')
+    if not isinstance(email, str):
+        raise ValueError(f'Invalid email: {email}')
+    if (not isinstance(roles, list)
+            or not all(isinstance(role, str) for role in roles)):
+        raise ValueError(f'Invalid roles: {roles}')
+    ppl.is_valid_person(name, affiliation, email, roles=roles)
+    return {
+        ppl.NAME: name,
+        ppl.AFFILIATION: affiliation,
+        ppl.EMAIL: email,
+        ppl.ROLES: roles,
+    }
+
+
+def import_chunk(chunk: list) -> list:
+    """
+    chunk is a list of (row number, record).
+    Returns the results for the chunk, in row order.
+    """
+    results = []
+    to_add = {}
+    for row, rec in chunk:
+        try:
+            person = to_person(rec)
+        except ValueError as err:
+            results.append({ROW: row, STATUS: INVALID, ERROR: str(err)})
+            continue
+        email = person[ppl.EMAIL]
+        if email in to_add:
+            results.append({ROW: row, ppl.EMAIL: email, STATUS: DUPLICATE})
+            continue
+        to_add[email] = (row, person)
+
+    existing = dbc.read(ppl.PEOPLE_COLLECT,
+                        filt={ppl.EMAIL: {'$in': list(to_add)}},
+                        projection=ppl.EXISTS_PROJECTION)
+    for person in existing:
+        row, _person = to_add.pop(person[ppl.EMAIL])
+        results.append({ROW: row, ppl.EMAIL: person[ppl.EMAIL],
+                        STATUS: DUPLICATE})
+
+    rows_and_people = list(to_add.values())
+    failures = dbc.insert_many(ppl.PEOPLE_COLLECT,
+                               [person for _row, person in rows_and_people])
+    for i, (row, person) in enumerate(rows_and_people):
+        email = person[ppl.EMAIL]
+        if i in failures:
+            results.append({ROW: row, ppl.EMAIL: email, STATUS: FAILED,
+                            ERROR: failures[i]})
+            continue
+        ppl.add_to_masthead(person)
+        results.append({ROW: row, ppl.EMAIL: email, STATUS: CREATED})
+    return sorted(results, key=lambda result: result[ROW])
+
+
+def import_people(recs, chunk_size: int = IMPORT_CHUNK_SIZE):
+    """
+    Import an iterable of person records, chunk_size at a time.
+    Yields one result per record, numbered from row 1.
+    """
+    numbered = enumerate(recs, start=1)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            return
+        yield from import_chunk(chunk)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import people.')
+    parser.add_argument('file', help='CSV or JSON-lines file')
+    parser.add_argument('--format', choices=FORMATS,
+                        help='defaults to the file extension')
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+    fmt = args.format or (CSV if args.file.endswith('.csv') else JSON_LINES)
+    counts = {}
+    with open(args.file, newline='') as lines:
+        for result in import_people(parse(lines, fmt), args.chunk_size):
+            counts[result[STATUS]] = counts.get(result[STATUS], 0) + 1
+            print(json.dumps(result))
+    print(f'{counts=}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
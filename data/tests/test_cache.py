@@ -0,0 +1,69 @@
+import data.cache as cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_local_cache_get_set():
+    lc = cache.LocalCache()
+    assert lc.get('k') == (False, None)
+    lc.set('k', None, ttl=10)
+    assert lc.get('k') == (True, None)
+
+
+def test_local_cache_expires():
+    clock = FakeClock()
+    lc = cache.LocalCache(clock=clock)
+    lc.set('k', 1, ttl=10)
+    clock.now = 9
+    assert lc.get('k') == (True, 1)
+    clock.now = 10
+    assert lc.get('k') == (False, None)
+
+
+def test_local_cache_lru_eviction():
+    lc = cache.LocalCache(max_size=2)
+    lc.set('a', 1, ttl=10)
+    lc.set('b', 2, ttl=10)
+    lc.get('a')
+    lc.set('c', 3, ttl=10)
+    assert lc.get('b') == (False, None)
+    assert lc.get('a') == (True, 1)
+    assert lc.stats()[cache.EVICTIONS] == 1
+
+
+def test_read_through_counts_and_copies():
+    rc = cache.ReadCache()
+    rc.configure('coll', ttl=10)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return {'val': 1}
+
+    doc = rc.read_through('db', 'coll', ({'k': 1},), load)
+    doc['val'] = 2
+    assert rc.read_through('db', 'coll', ({'k': 1},), load) == {'val': 1}
+    assert len(loads) == 1
+    assert rc.stats()['coll'] == {cache.HITS: 1, cache.MISSES: 1}
+
+
+def test_read_through_uncached_collection():
+    rc = cache.ReadCache()
+    loads = []
+    for _ in range(2):
+        rc.read_through('db', 'coll', (), lambda: loads.append(1))
+    assert len(loads) == 2
+
+
+def test_invalidate():
+    rc = cache.ReadCache()
+    rc.configure('coll', ttl=10)
+    rc.read_through('db', 'coll', (), lambda: 1)
+    rc.invalidate('db', 'coll')
+    assert rc.read_through('db', 'coll', (), lambda: 2) == 2
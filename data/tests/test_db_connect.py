@@ -0,0 +1,150 @@
+import pytest
+from bson import ObjectId
+from unittest.mock import patch
+
+import data.db_connect as dbc
+
+
+def test_get_pool_config_from_env():
+    with patch.dict('os.environ', {'MONGO_MAX_POOL_SIZE': '7',
+                                   'MONGO_CONNECT_TIMEOUT_MS': '250'}):
+        config = dbc.get_pool_config()
+    assert config['maxPoolSize'] == 7
+    assert config['connectTimeoutMS'] == 250
+
+
+def test_configure_pool_bad_option():
+    with pytest.raises(ValueError):
+        dbc.configure_pool(notAnOption=3)
+
+
+def test_configure_pool_overrides():
+    with patch.dict(dbc.pool_overrides, clear=True):
+        dbc.configure_pool(minPoolSize=2)
+        assert dbc.get_pool_config()['minPoolSize'] == 2
+    assert dbc.client is None
+
+
+def test_lazy_connect():
+    dbc.close_db()
+    assert dbc.client is None
+    dbc.read('people')
+    assert dbc.client is not None
+
+
+def test_reinit_after_fork():
+    dbc.connect_db()
+    dbc.pool_stats.bump(dbc.CREATED)
+    dbc.reinit_after_fork()
+    assert dbc.client is None
+    assert dbc.get_pool_stats()[dbc.CREATED] == 0
+
+
+def test_pool_stats_counts():
+    stats = dbc.PoolStats()
+    stats.connection_created(None)
+    stats.connection_check_out_started(None)
+    assert stats.snapshot()[dbc.WAITING] == 1
+    stats.connection_checked_out(None)
+    snapshot = stats.snapshot()
+    assert snapshot[dbc.WAITING] == 0
+    assert snapshot[dbc.CHECKED_OUT] == 1
+    assert snapshot[dbc.CREATED] == 1
+    stats.connection_checked_in(None)
+    assert stats.snapshot()[dbc.CHECKED_OUT] == 0
+
+
+def test_read_iter_streams():
+    recs = dbc.read_iter('people', projection={'email': 1}, batch_size=2)
+    assert not isinstance(recs, list)
+    for rec in recs:
+        assert dbc.MONGO_ID not in rec
+        assert set(rec.keys()) <= {'email'}
+
+
+def test_read_dict_iter_matches_read_dict():
+    assert dict(dbc.read_dict_iter('people', 'email')) \
+        == dbc.read_dict('people', 'email')
+
+
+PAGE_COLLECT = 'page_test'
+
+
+def test_read_page_walks_all_docs():
+    dbc.get_collection(PAGE_COLLECT).delete_many({})
+    for i in range(5):
+        dbc.create(PAGE_COLLECT, {'key': f'k{i}', 'val': i})
+    seen = []
+    after = None
+    while True:
+        docs, after = dbc.read_page(PAGE_COLLECT, 'key', 2, after=after)
+        seen += [doc['key'] for doc in docs]
+        if after is None:
+            break
+    assert seen == [f'k{i}' for i in range(5)]
+    dbc.get_collection(PAGE_COLLECT).delete_many({})
+
+
+def test_read_page_last_page():
+    dbc.get_collection(PAGE_COLLECT).delete_many({})
+    dbc.create(PAGE_COLLECT, {'key': 'only'})
+    docs, after = dbc.read_page(PAGE_COLLECT, 'key', 2)
+    assert len(docs) == 1
+    assert after is None
+    dbc.get_collection(PAGE_COLLECT).delete_many({})
+
+
+def test_insert_if_absent():
+    dbc.get_collection(PAGE_COLLECT).delete_many({})
+    assert dbc.insert_if_absent(PAGE_COLLECT, {'key': 'k'},
+                                {'key': 'k', 'val': 1})
+    assert not dbc.insert_if_absent(PAGE_COLLECT, {'key': 'k'},
+                                    {'key': 'k', 'val': 2})
+    doc = dbc.read_one(PAGE_COLLECT, {'key': 'k'})
+    assert doc['val'] == 1
+    dbc.get_collection(PAGE_COLLECT).delete_many({})
+
+
+def test_update_and_fetch():
+    dbc.get_collection(PAGE_COLLECT).delete_many({})
+    dbc.create(PAGE_COLLECT, {'key': 'k', 'val': 1})
+    doc = dbc.update_and_fetch(PAGE_COLLECT, {'key': 'k'}, {'val': 2})
+    assert doc['val'] == 2
+    assert isinstance(doc[dbc.MONGO_ID], ObjectId)
+    old = dbc.update_and_fetch(PAGE_COLLECT, {'key': 'k'}, {'val': 3},
+                               return_new=False)
+    assert old['val'] == 2
+    assert dbc.update_and_fetch(PAGE_COLLECT, {'key': 'nope'},
+                                {'val': 1}) is None
+    dbc.get_collection(PAGE_COLLECT).delete_many({})
+
+
+def test_read_one_cached():
+    dbc.get_collection(PAGE_COLLECT).delete_many({})
+    dbc.cache_reads(PAGE_COLLECT, 60)
+    try:
+        dbc.create(PAGE_COLLECT, {'key': 'k', 'val': 1})
+        assert dbc.read_one(PAGE_COLLECT, {'key': 'k'})['val'] == 1
+        assert dbc.fetch_one(PAGE_COLLECT, {'key': 'nope'}) is None
+        with patch.object(dbc, 'get_collection') as get_coll:
+            assert dbc.read_one(PAGE_COLLECT, {'key': 'k'})['val'] == 1
+            assert dbc.fetch_one(PAGE_COLLECT, {'key': 'nope'}) is None
+            get_coll.assert_not_called()
+        dbc.update_doc(PAGE_COLLECT, {'key': 'k'}, {'val': 2})
+        assert dbc.read_one(PAGE_COLLECT, {'key': 'k'})['val'] == 2
+    finally:
+        dbc.cache_reads(PAGE_COLLECT, None)
+        dbc.get_collection(PAGE_COLLECT).delete_many({})
+
+
+def test_versions_bumped_by_writes():
+    dbc.get_collection(PAGE_COLLECT).delete_many({})
+    dbc.track_versions(PAGE_COLLECT)
+    try:
+        start = dbc.get_version(PAGE_COLLECT)
+        dbc.create(PAGE_COLLECT, {'key': 'k'})
+        dbc.update_doc(PAGE_COLLECT, {'key': 'k'}, {'val': 1})
+        dbc.delete(PAGE_COLLECT, {'key': 'k'})
+        assert dbc.get_version(PAGE_COLLECT) == start + 3
+    finally:
+        dbc.versioned.discard(PAGE_COLLECT)
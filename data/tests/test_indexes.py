@@ -0,0 +1,66 @@
+import pytest
+
+import data.db_connect as dbc
+import data.indexes as idx
+
+TEST_DB = 'indexTestDB'
+
+
+@pytest.fixture
+def empty_db():
+    dbc.connect_db().drop_database(TEST_DB)
+    yield TEST_DB
+    dbc.connect_db().drop_database(TEST_DB)
+
+
+def test_get_required_indexes():
+    indexes = idx.get_required_indexes()
+    assert isinstance(indexes, dict)
+    for collection, specs in indexes.items():
+        assert isinstance(collection, str)
+        for spec in specs:
+            assert len(spec[idx.KEYS]) > 0
+
+
+def test_has_index():
+    spec = {idx.KEYS: [('email', 1)], idx.UNIQUE: True}
+    assert idx.has_index({'e': {'key': [('email', 1)], 'unique': True}},
+                         spec)
+    assert not idx.has_index({'e': {'key': [('email', 1)]}}, spec)
+    assert not idx.has_index({'e': {'key': [('name', 1)]}}, spec)
+
+
+def test_has_index_other_directions():
+    spec = {idx.KEYS: [('email', 1)], idx.UNIQUE: False}
+    text_idx = {'key': [('_fts', 'text'), ('_ftsx', 1)]}
+    geo_idx = {'key': [('loc', '2dsphere')]}
+    assert not idx.has_index({'t': text_idx, 'g': geo_idx}, spec)
+    assert idx.has_index({'t': text_idx, 'e': {'key': [('email', 1.0)]}},
+                         spec)
+
+
+def test_create_all_then_nothing_missing(empty_db):
+    assert len(idx.get_missing(db=empty_db)) > 0
+    idx.create_all(db=empty_db)
+    assert idx.get_missing(db=empty_db) == []
+    # idempotent:
+    idx.create_all(db=empty_db)
+    assert idx.get_missing(db=empty_db) == []
+
+
+def test_check_fail(empty_db):
+    with pytest.raises(RuntimeError):
+        idx.check(idx.CHECK_FAIL, db=empty_db)
+
+
+def test_check_log(empty_db):
+    assert len(idx.check(idx.CHECK_LOG, db=empty_db)) > 0
+
+
+def test_check_create(empty_db):
+    assert idx.check(idx.CHECK_CREATE, db=empty_db) == []
+
+
+def test_check_bad_mode():
+    with pytest.raises(ValueError):
+        idx.check('not a mode')
@@ -4,7 +4,7 @@ from data.roles import TEST_CODE as TEST_ROLE_CODE
 from data.people import get_person, TEST_EMAIL, NAME, ROLES, AFFILIATION, EMAIL
 from data.people import get_masthead, create_person, delete_person, NAME, ROLES, EMAIL
 from data.roles import TEST_CODE
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 import data.db_connect as dbc
 
 TEMP_EMAIL = 'temp_person2@temp.org'
@@ -314,3 +314,154 @@ def test_create_person_multiple_roles():
     assert VALID_ROLES[0] not in updated_person[ROLES]
     assert VALID_ROLES[1] in updated_person[ROLES]
     ppl.delete_person(email)
+
+
+MH_EMAIL = 'masthead_editor@nyu.edu'
+
+
+def test_get_masthead_has_editor():
+    if ppl.exists(MH_EMAIL):
+        ppl.delete_person(MH_EMAIL)
+    ppl.create_person('Masthead Editor', 'NYU', MH_EMAIL, roles=['ED', 'AU'])
+    mh = ppl.get_masthead()
+    assert set(mh.keys()) == set(ppl.rls.get_masthead_roles().values())
+    editors = mh[ppl.rls.ROLES[ppl.rls.ED_CODE]]
+    assert MH_EMAIL in editors
+    assert editors[MH_EMAIL] == {NAME: 'Masthead Editor',
+                                 AFFILIATION: 'NYU'}
+    for text, people in mh.items():
+        if text != ppl.rls.ROLES[ppl.rls.ED_CODE]:
+            assert MH_EMAIL not in people
+    ppl.delete_person(MH_EMAIL)
+
+
+def test_get_masthead_skips_non_mh_roles(temp_person):
+    mh = ppl.get_masthead()
+    for people in mh.values():
+        assert temp_person not in people
+
+
+def test_read_masthead_matches_live():
+    if ppl.exists(MH_EMAIL):
+        ppl.delete_person(MH_EMAIL)
+    ppl.rebuild_masthead()
+    assert ppl.read_masthead() == ppl.get_masthead()
+
+    ppl.create_person('Masthead Editor', 'NYU', MH_EMAIL, roles=['ED'])
+    assert MH_EMAIL in ppl.read_masthead()[ppl.rls.ROLES[ppl.rls.ED_CODE]]
+    assert ppl.read_masthead() == ppl.get_masthead()
+
+    ppl.update_person('Masthead Editor', 'Columbia', MH_EMAIL, ['CE', 'ME'])
+    mh = ppl.read_masthead()
+    assert MH_EMAIL not in mh[ppl.rls.ROLES[ppl.rls.ED_CODE]]
+    assert mh[ppl.rls.ROLES[ppl.rls.CE_CODE]][MH_EMAIL][AFFILIATION] \
+        == 'Columbia'
+    assert mh == ppl.get_masthead()
+
+    ppl.delete_person(MH_EMAIL)
+    assert ppl.read_masthead() == ppl.get_masthead()
+
+
+def test_add_to_masthead_twice():
+    if ppl.exists(MH_EMAIL):
+        ppl.delete_person(MH_EMAIL)
+    ppl.create_person('Masthead Editor', 'NYU', MH_EMAIL, roles=['ED'])
+    ppl.add_to_masthead(ppl.read_one(MH_EMAIL))
+    mh_doc = dbc.fetch_one(ppl.MASTHEAD_COLLECT, ppl.MH_FILTER)
+    emails = [entry[EMAIL] for entry in mh_doc[ppl.rls.ED_CODE]]
+    assert emails.count(MH_EMAIL) == 1
+    assert ppl.read_masthead() == ppl.get_masthead()
+    ppl.delete_person(MH_EMAIL)
+
+
+def test_add_to_masthead_overlapping():
+    if ppl.exists(MH_EMAIL):
+        ppl.delete_person(MH_EMAIL)
+    ppl.create_person('Masthead Editor', 'NYU', MH_EMAIL, roles=['ED'])
+    person = ppl.read_one(MH_EMAIL)
+    real_read = dbc.read
+    racing = [True]
+
+    def racing_read(*args, **kwargs):
+        docs = real_read(*args, **kwargs)
+        if racing:
+            # another update to the same person lands after our read:
+            racing.pop()
+            ppl.add_to_masthead(person)
+        return docs
+
+    with patch.object(dbc, 'read', side_effect=racing_read):
+        ppl.add_to_masthead(person)
+    mh_doc = dbc.fetch_one(ppl.MASTHEAD_COLLECT, ppl.MH_FILTER)
+    emails = [entry[EMAIL] for entry in mh_doc[ppl.rls.ED_CODE]]
+    assert emails.count(MH_EMAIL) == 1
+    ppl.delete_person(MH_EMAIL)
+
+
+def test_add_to_masthead_gives_up():
+    if ppl.exists(MH_EMAIL):
+        ppl.delete_person(MH_EMAIL)
+    ppl.create_person('Masthead Editor', 'NYU', MH_EMAIL, roles=['ED'])
+    with patch.object(dbc, 'modify_doc',
+                      return_value=MagicMock(matched_count=0)):
+        ppl.add_to_masthead(ppl.read_one(MH_EMAIL))
+    # dropped, so the next read rebuilds it:
+    assert dbc.fetch_one(ppl.MASTHEAD_COLLECT, ppl.MH_FILTER) is None
+    assert ppl.read_masthead() == ppl.get_masthead()
+    ppl.delete_person(MH_EMAIL)
+
+
+def test_read_masthead_rebuilds_when_missing():
+    dbc.delete(ppl.MASTHEAD_COLLECT, ppl.MH_FILTER)
+    assert ppl.read_masthead() == ppl.get_masthead()
+    assert dbc.fetch_one(ppl.MASTHEAD_COLLECT, ppl.MH_FILTER) is not None
+
+
+def test_read_iter(temp_person):
+    people = dict(ppl.read_iter(batch_size=1))
+    assert temp_person in people
+    assert people == ppl.read()
+
+
+def test_read_page(temp_person):
+    people, next_after = ppl.read_page(1, after=temp_person[:-1])
+    assert temp_person in people
+    assert len(people) == 1
+
+
+def test_read_one_projection(temp_person):
+    person = ppl.read_one(temp_person, projection={EMAIL: 1})
+    assert person[EMAIL] == temp_person
+    assert NAME not in person
+
+
+USER_EMAIL = 'proj_user@nyu.edu'
+
+
+def test_get_user_by_email_hides_password():
+    dbc.delete(ppl.USER_COLLECT, {EMAIL: USER_EMAIL})
+    ppl.register_user(USER_EMAIL, 'secret', 'editor')
+    user = ppl.get_user_by_email(USER_EMAIL)
+    assert ppl.PASSWORD not in user
+    assert user[ppl.USER_ROLE] == 'editor'
+    assert ppl.login_user(USER_EMAIL, 'secret')
+    dbc.delete(ppl.USER_COLLECT, {EMAIL: USER_EMAIL})
+
+
+def test_register_duplicate_user():
+    dbc.delete(ppl.USER_COLLECT, {EMAIL: USER_EMAIL})
+    ppl.register_user(USER_EMAIL, 'secret')
+    with pytest.raises(ValueError):
+        ppl.register_user(USER_EMAIL, 'other secret')
+    dbc.delete(ppl.USER_COLLECT, {EMAIL: USER_EMAIL})
+
+
+def test_read_users_page_any_case():
+    dbc.delete(ppl.USER_COLLECT, {EMAIL: USER_EMAIL})
+    ppl.register_user(USER_EMAIL, 'secret', 'Managing Editor')
+    assert ppl.get_user_by_email(USER_EMAIL)[ppl.USER_ROLE] \
+        == 'managing editor'
+    users, _ = ppl.read_users_page(100, after=USER_EMAIL[:-1],
+                                   roles=['MANAGING EDITOR'])
+    assert USER_EMAIL in users
+    dbc.delete(ppl.USER_COLLECT, {EMAIL: USER_EMAIL})
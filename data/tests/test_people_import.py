@@ -0,0 +1,93 @@
+import pytest
+
+import data.people as ppl
+import data.people_import as pim
+
+IMPORT_EMAILS = ['import1@nyu.edu', 'import2@nyu.edu', 'import3@nyu.edu']
+
+CSV_LINES = [
+    'name,affiliation,email,roles\n',
+    f'Import One,NYU,{IMPORT_EMAILS[0]},AU;ED\n',
+    f'Import Two,NYU,{IMPORT_EMAILS[1]},\n',
+]
+
+
+@pytest.fixture
+def clean_import():
+    for email in IMPORT_EMAILS:
+        ppl.delete_person(email)
+    yield IMPORT_EMAILS
+    for email in IMPORT_EMAILS:
+        ppl.delete_person(email)
+
+
+def test_parse_csv():
+    recs = list(pim.parse(CSV_LINES, pim.CSV))
+    assert len(recs) == 2
+    assert recs[0][ppl.ROLES] == ['AU', 'ED']
+    assert recs[1][ppl.ROLES] == []
+
+
+def test_parse_json_lines():
+    recs = list(pim.parse(['{"name": "A"}\n', '\n', 'not json\n'],
+                          pim.JSON_LINES))
+    assert recs[0] == {ppl.NAME: 'A'}
+    assert pim.ERROR in recs[1]
+
+
+def test_parse_bad_format():
+    with pytest.raises(ValueError):
+        pim.parse([], 'xml')
+
+
+def test_to_person_bad_email():
+    with pytest.raises(ValueError):
+        pim.to_person({ppl.NAME: 'Some One', ppl.EMAIL: 'not an email'})
+
+
+def test_to_person_bad_role():
+    with pytest.raises(ValueError):
+        pim.to_person({ppl.NAME: 'Some One', ppl.EMAIL: 'a@nyu.edu',
+                       ppl.ROLES: ['Not a role']})
+
+
+@pytest.mark.parametrize('bad_fields', [
+    {ppl.NAME: 12345},
+    {ppl.AFFILIATION: 42},
+    {ppl.ROLES: 5},
+    {ppl.ROLES: {'ED': 1}},
+    {ppl.ROLES: [['ED']]},
+])
+def test_to_person_wrong_types(bad_fields):
+    rec = {ppl.NAME: 'Some One', ppl.EMAIL: 'a@nyu.edu', **bad_fields}
+    with pytest.raises(ValueError):
+        pim.to_person(rec)
+    results = pim.import_chunk([(1, rec)])
+    assert results[0][pim.STATUS] == pim.INVALID
+
+
+def test_import_people(clean_import):
+    first, second, third = clean_import
+    ppl.create_person('Already Here', 'NYU', third, roles=[])
+    recs = list(pim.parse(CSV_LINES, pim.CSV)) + [
+        {ppl.NAME: 'Import Three', ppl.EMAIL: third},
+        {ppl.NAME: 'Bad Email', ppl.EMAIL: 'nope'},
+        {ppl.NAME: 'Import One Again', ppl.EMAIL: first},
+    ]
+    results = list(pim.import_people(recs, chunk_size=2))
+    assert [result[pim.ROW] for result in results] == [1, 2, 3, 4, 5]
+    assert [result[pim.STATUS] for result in results] == [
+        pim.CREATED, pim.CREATED, pim.DUPLICATE, pim.INVALID,
+        pim.DUPLICATE,
+    ]
+    assert ppl.read_one(first)[ppl.ROLES] == ['AU', 'ED']
+    assert first in ppl.read_masthead()[ppl.rls.ROLES[ppl.rls.ED_CODE]]
+    assert ppl.read_masthead() == ppl.get_masthead()
+
+
+def test_import_people_dupes_in_chunk(clean_import):
+    first = clean_import[0]
+    recs = [{ppl.NAME: 'Twin One', ppl.EMAIL: first},
+            {ppl.NAME: 'Twin Two', ppl.EMAIL: first}]
+    statuses = [result[pim.STATUS] for result in pim.import_people(recs)]
+    assert statuses == [pim.CREATED, pim.DUPLICATE]
@@ -1,6 +1,18 @@
 import pytest
+from unittest.mock import patch
+
+import data.db_connect as dbc
 import data.text as txt
 
+SCRATCH_COLLECT = 'test_texts'
+
+
+@pytest.fixture(scope='module', autouse=True)
+def seeded():
+    # Some tests expect the defaults, which may have been deleted.
+    txt.seed()
+    txt.load()
+
 
 def test_read():
     texts = txt.read()
@@ -77,3 +89,49 @@ def test_read_one():
 def test_read_one_not_found():
     assert txt.read_one('Not a page key!') == {}
 
+
+def test_sees_other_workers_writes():
+    key = 'OtherWorkerPage'
+    txt.read()
+    if txt.read_one(key):
+        txt.delete_text(key)
+    # as another worker would:
+    dbc.create(txt.TEXT_COLLECT, {txt.KEY: key, txt.TITLE: 'Other',
+                                  txt.TEXT: 'Written elsewhere'})
+    with patch.dict('os.environ', {txt.RELOAD_ENV: '3600'}):
+        assert key not in txt.read()
+    with patch.dict('os.environ', {txt.RELOAD_ENV: '0'}):
+        assert txt.read()[key][txt.TITLE] == 'Other'
+    txt.delete_text(key)
+    assert key not in txt.read()
+
+
+def test_reads_stay_in_memory():
+    txt.read()
+    with patch.dict('os.environ', {txt.RELOAD_ENV: '3600'}), \
+            patch.object(dbc, 'get_collection') as get_coll:
+        txt.read()
+        txt.read_one(txt.HOMEPAGE_KEY)
+        get_coll.assert_not_called()
+
+
+def test_seed():
+    with patch.object(txt, 'TEXT_COLLECT', SCRATCH_COLLECT), \
+            patch.object(dbc, 'versioned', {SCRATCH_COLLECT}):
+        for key in txt.DEFAULT_TEXTS:
+            dbc.delete(SCRATCH_COLLECT, {txt.KEY: key})
+        dbc.delete(dbc.VERSIONS_COLLECT, {dbc.MONGO_ID: SCRATCH_COLLECT})
+        # a collection that was never written gets the defaults:
+        txt.load()
+        assert txt.text_dict == txt.DEFAULT_TEXTS
+        txt.seed()
+        assert len(dbc.read(SCRATCH_COLLECT)) == len(txt.DEFAULT_TEXTS)
+        # but pages deleted on purpose stay deleted:
+        for key in txt.DEFAULT_TEXTS:
+            txt.delete_text(key)
+        txt.load()
+        assert txt.text_dict == {}
+        assert dbc.read(SCRATCH_COLLECT) == []
+        dbc.delete(dbc.VERSIONS_COLLECT, {dbc.MONGO_ID: SCRATCH_COLLECT})
+    txt.load()
+    assert txt.read_one(txt.HOMEPAGE_KEY)
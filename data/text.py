@@ -1,6 +1,19 @@
 """
-This module interfaces to our user data.
+This module interfaces to our text pages.
+Pages live in the texts collection, so every worker serves the same
+ones. Each process keeps them all in text_dict and serves reads from
+there. At most every TEXT_RELOAD_SECS it checks the collection's
+version, and reloads if any process has written since.
 """
+import argparse
+import os
+import threading
+import time
+from functools import wraps
+
+import data.db_connect as dbc
+
+TEXT_COLLECT = 'texts'
 
 # fields
 KEY = 'key'
@@ -12,7 +25,9 @@ HOMEPAGE_KEY = 'HomePage'
 DEL_KEY = 'DeletePage'
 SUBMISSION_KEY = 'SubmissionPage'
 
-text_dict = {
+# Stored by seed(). load() seeds a collection that was never written
+# (its version is still 0), so pages deleted on purpose stay deleted.
+DEFAULT_TEXTS = {
     HOMEPAGE_KEY: {
         TITLE: 'Home Page',
         TEXT: 'This is a journal about building API servers.',
@@ -25,57 +40,160 @@ Author, Email, and Abstract in your submission.'
     }
 }
 
+dbc.track_versions(TEXT_COLLECT)
+RELOAD_ENV = 'TEXT_RELOAD_SECS'
+DEF_RELOAD_SECS = 2
+
+# This process's copy of the texts collection, as of loaded_version.
+text_dict = {}
+loaded_version = None
+last_check = 0.0
+reload_lock = threading.Lock()
+
+# Called with (text_dict, loaded_version) after every (re)load, e.g.
+# to rebuild caches derived from the pages.
+reload_listeners = []
 
+
+def add_reload_listener(listener):
+    reload_listeners.append(listener)
+
+
+def seed():
+    """
+    Store any default page that is missing.
+    """
+    for key, page in DEFAULT_TEXTS.items():
+        dbc.insert_if_absent(TEXT_COLLECT, {KEY: key}, {KEY: key, **page})
+
+
+def load():
+    """
+    (Re)load every page from the DB into text_dict.
+    """
+    global text_dict, loaded_version, last_check
+    # Version first: a write landing in between just means we reload
+    # again on the next check.
+    version = dbc.get_version(TEXT_COLLECT)
+    texts = {}
+    for key, page in dbc.read_dict_iter(TEXT_COLLECT, KEY):
+        del page[KEY]
+        texts[key] = page
+    if not texts and version == 0:
+        # A fresh DB: seeding bumps the version, so this happens once.
+        seed()
+        return load()
+    text_dict = texts
+    loaded_version = version
+    last_check = time.monotonic()
+    for listener in reload_listeners:
+        listener(text_dict, loaded_version)
+
+
+def get_reload_secs() -> float:
+    return float(os.environ.get(RELOAD_ENV, DEF_RELOAD_SECS))
+
+
+def refresh():
+    """
+    Reload if the version has moved, looking at most once every
+    get_reload_secs(). If the DB can't be reached we keep what we have.
+    """
+    global last_check
+    now = time.monotonic()
+    if now - last_check < get_reload_secs():
+        return
+    if not reload_lock.acquire(blocking=False):
+        return
+    try:
+        last_check = now
+        if dbc.get_version(TEXT_COLLECT) != loaded_version:
+            load()
+    except Exception as e:
+        print(f'Could not reload texts: {e}')
+    finally:
+        reload_lock.release()
+
+
+def needs_texts(fn):
+    """
+    Decorate anything that uses text_dict.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if loaded_version is None:
+            load()
+        else:
+            refresh()
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+@needs_texts
+def get_version() -> int:
+    """
+    The version of the texts this process is serving.
+    """
+    return loaded_version
+
+
+@needs_texts
 def read():  # test function added
     """
     Our contract:
         - No arguments.
-        - Returns a dictionary of users keyed on user email.
-        - Each user email must be the key for another dictionary.
+        - Returns a dictionary of text pages keyed on page key.
+        - Each page key must be the key for another dictionary.
     """
     text = text_dict
     return text
 
 
+@needs_texts
 def create_text(key, title, text):  # test function added
     """
-    Create a new text entry in text_dict.
+    Create a new text entry.
     - key: A unique identifier for the text
     - title: The title of the page.
     - text: The content of the page.
     """
-    if key in text_dict:
-        raise ValueError(f'Text with key "{key}" already exists.')
-
-    text_dict[key] = {
+    page = {
         TITLE: title,
         TEXT: text
     }
-    return text_dict[key]
+    if not dbc.insert_if_absent(TEXT_COLLECT, {KEY: key},
+                                {KEY: key, **page}):
+        raise ValueError(f'Text with key "{key}" already exists.')
+    # Reload so text_dict always matches loaded_version.
+    load()
+    return page
 
 
+@needs_texts
 def update_text(key, title, text):  # test function added
-    if key not in text_dict:
+    page = {
+        TITLE: title,
+        TEXT: text
+    }
+    result = dbc.update_doc(TEXT_COLLECT, {KEY: key}, page)
+    if result.matched_count == 0:
         raise ValueError(f'Text with key "{key}" does not exist.')
-    else:
-        text_dict[key] = {
-            TITLE: title,
-            TEXT: text
-        }
-    return text_dict[key]
+    load()
+    return page
 
 
+@needs_texts
 def delete_text(key):
     """
-    Delete an existing text entry from text_dict.
+    Delete an existing text entry.
     """
-    if key not in text_dict:
+    if not dbc.delete(TEXT_COLLECT, {KEY: key}):
         raise ValueError(f'Text with key "{key}" does not exist.')
-
-    del text_dict[key]
+    load()
     return {"message": f"Text with key '{key}' has been deleted."}
 
 
+@needs_texts
 def read_one(key: str) -> dict:
     # This should take a key and return the page dictionary
     # for that key. Return an empty dictionary of key not found.
@@ -86,6 +204,13 @@ def read_one(key: str) -> dict:
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Manage text pages.')
+    parser.add_argument('command', nargs='?', default='read',
+                        choices=['read', 'seed'],
+                        help='seed: store any missing default page')
+    args = parser.parse_args()
+    if args.command == 'seed':
+        seed()
     print(read())
 
 
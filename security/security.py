@@ -1,6 +1,12 @@
+import argparse
+import os
+import threading
+import time
+from dataclasses import dataclass
 from functools import wraps
 
-# import data.db_connect as dbc
+import data.cache as cache
+import data.db_connect as dbc
 
 """
 Our record format to meet our requirements (see security.md) will be:
@@ -49,6 +55,7 @@ Our record format to meet our requirements (see security.md) will be:
 """
 
 COLLECT_NAME = 'security'
+FEATURE_NAME = 'feature_name'  # the field DB records are keyed on
 CREATE = 'create'
 READ = 'read'
 UPDATE = 'update'
@@ -71,6 +78,24 @@ GOOD_USER_ID = 'ejc369@nyu.edu'
 
 security_recs = None
 
+# (feature, action) -> Policy, compiled from security_recs by read().
+policies = {}
+
+# Records live in the DB, one doc per feature. Every write bumps the
+# collection's version; each process checks that version at most every
+# SECURITY_RELOAD_SECS and recompiles when it has moved.
+dbc.track_versions(COLLECT_NAME)
+RELOAD_ENV = 'SECURITY_RELOAD_SECS'
+DEF_RELOAD_SECS = 5
+
+loaded_version = None
+last_check = 0.0
+reload_lock = threading.Lock()
+
+# Optional cache of decisions; see enable_decision_cache().
+decision_cache = None
+decision_ttl = 60
+
 PEOPLE_CHANGE_PERMISSIONS = {
     # USER_LIST: [GOOD_USER_ID],
     CHECKS: {
@@ -78,7 +103,7 @@ PEOPLE_CHANGE_PERMISSIONS = {
     },
 }
 
-# These will come from the DB soon:
+# The protection for any feature that has no record in the DB:
 TEST_RECS = {
     PEOPLE: {
         CREATE: PEOPLE_CHANGE_PERMISSIONS,
@@ -143,22 +168,153 @@ CHECK_FUNCS = {
 }
 
 
+def bad_check(name: str):
+    def check(user_id: str, **kwargs):
+        raise ValueError(f'Bad check passed to is_permitted: {name}')
+    return check
+
+
+@dataclass(frozen=True)
+class Policy:
+    """
+    One (feature, action)'s rules, compiled for fast evaluation.
+    users is None when anyone may try; checks are (name, function)
+    pairs in record order.
+    """
+    users: frozenset = None
+    checks: tuple = ()
+
+    def allows(self, user_id: str, **kwargs) -> bool:
+        return self.evaluate(user_id, kwargs, {})
+
+    def evaluate(self, user_id: str, kwargs: dict,
+                 check_results: dict) -> bool:
+        """
+        check_results remembers each check's outcome by name, so a check
+        shared by several policies runs once for the same inputs.
+        """
+        if self.users is not None and user_id not in self.users:
+            return False
+        for name, check in self.checks:
+            if name not in check_results:
+                check_results[name] = check(user_id, **kwargs)
+            if not check_results[name]:
+                return False
+        return True
+
+
+def compile_policy(prot: dict) -> Policy:
+    users = None
+    if USER_LIST in prot:
+        users = frozenset(prot[USER_LIST])
+    # An unknown check still raises, but only when it is reached, as it
+    # did before we compiled.
+    checks = tuple((name, CHECK_FUNCS.get(name) or bad_check(name))
+                   for name in prot.get(CHECKS, {}))
+    return Policy(users, checks)
+
+
+def compile_recs(recs: dict) -> dict:
+    """
+    Flatten security records to {(feature, action): Policy}.
+    """
+    return {(feature, action): compile_policy(prot)
+            for feature, actions in recs.items()
+            for action, prot in actions.items()}
+
+
+def read_db_recs() -> dict:
+    recs = {}
+    for feature, rec in dbc.read_dict_iter(COLLECT_NAME, FEATURE_NAME):
+        del rec[FEATURE_NAME]
+        recs[feature] = rec
+    return recs
+
+
 def read() -> dict:
-    global security_recs
-    # dbc.read()
-    security_recs = TEST_RECS
+    """
+    Load the records from the DB and compile them.
+    A feature's DB record replaces its TEST_RECS one; features missing
+    from the DB keep their TEST_RECS protection, so storing one record
+    never drops the checks on the others.
+    """
+    global security_recs, policies, loaded_version, last_check
+    # Read the version first: if a write lands in between, we load the
+    # newer recs under the older version and just reload next check.
+    version = dbc.get_version(COLLECT_NAME)
+    recs = {**TEST_RECS, **read_db_recs()}
+    policies = compile_recs(recs)
+    security_recs = recs
+    loaded_version = version
+    last_check = time.monotonic()
+    if decision_cache is not None:
+        decision_cache.clear()
     return security_recs
 
 
+def get_reload_secs() -> float:
+    return float(os.environ.get(RELOAD_ENV, DEF_RELOAD_SECS))
+
+
+def refresh():
+    """
+    Reload the records if their version has moved, checking at most
+    once every get_reload_secs(). One thread checks; the rest carry on
+    with the records they have. If the DB can't be reached we keep
+    what we have.
+    """
+    global last_check
+    now = time.monotonic()
+    if now - last_check < get_reload_secs():
+        return
+    if not reload_lock.acquire(blocking=False):
+        return
+    try:
+        last_check = now
+        if dbc.get_version(COLLECT_NAME) != loaded_version:
+            read()
+    except Exception as e:
+        print(f'Could not reload security records: {e}')
+    finally:
+        reload_lock.release()
+
+
+def save_feature(feature_name: str, prot: dict):
+    """
+    Store (or replace) one feature's record. Every process picks it up
+    within get_reload_secs().
+    """
+    dbc.replace_doc(COLLECT_NAME, {FEATURE_NAME: feature_name},
+                    {FEATURE_NAME: feature_name, **prot}, upsert=True)
+
+
+def delete_feature(feature_name: str):
+    dbc.delete(COLLECT_NAME, {FEATURE_NAME: feature_name})
+
+
+def enable_decision_cache(max_size: int = cache.DEF_MAX_SIZE,
+                          ttl: float = 60):
+    """
+    Remember up to max_size decisions for ttl seconds. Worth it when
+    checks are costly (a key lookup, say); ttl bounds how long a
+    revoked key keeps working. Pass max_size=0 to turn it off.
+    """
+    global decision_cache, decision_ttl
+    decision_cache = (cache.LocalCache(max_size=max_size) if max_size
+                      else None)
+    decision_ttl = ttl
+
+
 def needs_recs(fn):
     """
     Should be used to decorate any function that directly accesses sec recs.
     """
     @wraps(fn)
     def wrapper(*args, **kwargs):
-        global security_recs
         if not security_recs:
-            security_recs = read()
+            read()
+        else:
+            refresh()
         return fn(*args, **kwargs)
     return wrapper
 
@@ -172,21 +328,57 @@ def read_feature(feature_name: str) -> dict:
 
 
 @needs_recs
+def get_policy(feature_name: str, action: str) -> Policy:
+    return policies.get((feature_name, action))
+
+
 def is_permitted(feature_name: str, action: str,
                  user_id: str, **kwargs) -> bool:
-    prot = read_feature(feature_name)
-    if prot is None:
+    policy = get_policy(feature_name, action)
+    if policy is None:
         return True
-    if action not in prot:
-        return True
-    if USER_LIST in prot[action]:
-        if user_id not in prot[action][USER_LIST]:
-            return False
-    if CHECKS not in prot[action]:
-        return True
-    for check in prot[action][CHECKS]:
-        if check not in CHECK_FUNCS:
-            raise ValueError(f'Bad check passed to is_permitted: {check}')
-        if not CHECK_FUNCS[check](user_id, **kwargs):
-            return False
-    return True
\ No newline at end of file
+    if decision_cache is None:
+        return policy.allows(user_id, **kwargs)
+    try:
+        key = (feature_name, action, user_id,
+               tuple(sorted(kwargs.items())))
+        hash(key)
+    except TypeError:
+        return policy.allows(user_id, **kwargs)
+    found, decision = decision_cache.get(key)
+    if not found:
+        decision = policy.allows(user_id, **kwargs)
+        decision_cache.set(key, decision, decision_ttl)
+    return decision
+
+
+@needs_recs
+def is_permitted_many(user_id: str, pairs, **kwargs) -> dict:
+    """
+    Evaluate many (feature, action) pairs for one user in one go,
+    running each distinct check at most once.
+    Returns {feature: {action: allowed}}.
+    """
+    check_results = {}
+    permitted = {}
+    for feature_name, action in pairs:
+        policy = policies.get((feature_name, action))
+        allowed = (policy is None
+                   or policy.evaluate(user_id, kwargs, check_results))
+        permitted.setdefault(feature_name, {})[action] = allowed
+    return permitted
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Manage security records.')
+    parser.add_argument('command', choices=['seed'],
+                        help='seed: store TEST_RECS (minus the bad one)')
+    parser.parse_args()
+    for feature, prot in TEST_RECS.items():
+        if feature != BAD_FEATURE:
+            save_feature(feature, prot)
+    print(f'Stored: {sorted(read_db_recs())}')
+
+
+if __name__ == '__main__':
+    main()
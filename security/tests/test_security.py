@@ -1,4 +1,5 @@
 import pytest
+from unittest.mock import patch
 
 import security.security as sec
 
@@ -44,4 +45,136 @@ def test_is_permitted_bad_check():
 
 def test_is_permitted_all_good():
     assert sec.is_permitted(sec.PEOPLE, sec.CREATE, sec.GOOD_USER_ID,
-                            login_key='any key for now')
\ No newline at end of file
+                            login_key='any key for now')
+
+
+def test_compile_recs():
+    policies = sec.compile_recs(sec.TEST_RECS)
+    policy = policies[(sec.TEXTS, sec.CREATE)]
+    assert policy.users == frozenset([sec.GOOD_USER_ID])
+    assert [name for name, _check in policy.checks] == [sec.LOGIN]
+    assert policies[(sec.PEOPLE, sec.CREATE)].users is None
+    assert (sec.PEOPLE, sec.PEOPLE_MISSING_ACTION) not in policies
+
+
+def test_policy_is_frozen():
+    policy = sec.get_policy(sec.PEOPLE, sec.CREATE)
+    with pytest.raises(AttributeError):
+        policy.users = frozenset()
+
+
+def test_big_user_list():
+    users = [f'user{i}@nyu.edu' for i in range(10_000)]
+    policy = sec.compile_policy({sec.USER_LIST: users,
+                                 sec.CHECKS: {sec.LOGIN: True}})
+    assert policy.allows(users[-1], login_key='key')
+    assert not policy.allows('stranger@nyu.edu', login_key='key')
+
+
+def test_is_permitted_user_list():
+    assert sec.is_permitted(sec.TEXTS, sec.CREATE, sec.GOOD_USER_ID,
+                            login_key='key')
+    assert not sec.is_permitted(sec.TEXTS, sec.CREATE, 'someone else',
+                                login_key='key')
+
+
+def test_decision_cache():
+    sec.enable_decision_cache(max_size=10)
+    try:
+        calls = []
+
+        def counting_check(user_id, **kwargs):
+            calls.append(user_id)
+            return True
+
+        policy = sec.Policy(checks=((sec.LOGIN, counting_check),))
+        with patch.dict(sec.policies, {('feature', sec.CREATE): policy}):
+            for _ in range(3):
+                assert sec.is_permitted('feature', sec.CREATE, 'user',
+                                        login_key='key')
+            assert len(calls) == 1
+            sec.is_permitted('feature', sec.CREATE, 'user',
+                             login_key='other key')
+            assert len(calls) == 2
+        # bad checks still raise with the cache on:
+        with pytest.raises(ValueError):
+            sec.is_permitted(sec.BAD_FEATURE, sec.CREATE, sec.GOOD_USER_ID)
+    finally:
+        sec.enable_decision_cache(max_size=0)
+
+
+DB_FEATURE = 'db feature'
+
+
+@pytest.fixture
+def db_feature():
+    sec.save_feature(DB_FEATURE, {
+        sec.CREATE: {sec.USER_LIST: [sec.GOOD_USER_ID]},
+    })
+    sec.read()
+    yield DB_FEATURE
+    sec.delete_feature(DB_FEATURE)
+    sec.read()
+
+
+def test_read_from_db(db_feature):
+    assert sec.is_permitted(db_feature, sec.CREATE, sec.GOOD_USER_ID)
+    assert not sec.is_permitted(db_feature, sec.CREATE, 'someone else')
+    # features not in the DB keep their TEST_RECS protection:
+    assert sec.read_feature(sec.TEXTS) == sec.TEST_RECS[sec.TEXTS]
+    assert not sec.is_permitted(sec.PEOPLE, sec.CREATE, sec.GOOD_USER_ID)
+
+
+def test_hot_reload(db_feature):
+    sec.save_feature(db_feature, {sec.CREATE: {sec.USER_LIST: []}})
+    with patch.dict('os.environ', {sec.RELOAD_ENV: '3600'}):
+        # not time to look yet:
+        assert sec.is_permitted(db_feature, sec.CREATE, sec.GOOD_USER_ID)
+    with patch.dict('os.environ', {sec.RELOAD_ENV: '0'}):
+        assert not sec.is_permitted(db_feature, sec.CREATE,
+                                    sec.GOOD_USER_ID)
+
+
+def test_refresh_skips_unchanged_version():
+    sec.read()
+    with patch.dict('os.environ', {sec.RELOAD_ENV: '0'}), \
+            patch.object(sec, 'read') as read:
+        sec.refresh()
+        read.assert_not_called()
+
+
+def test_refresh_keeps_recs_on_db_error():
+    sec.read()
+    policies = sec.policies
+    with patch.dict('os.environ', {sec.RELOAD_ENV: '0'}), \
+            patch.object(sec.dbc, 'get_version', side_effect=OSError):
+        sec.refresh()
+    assert sec.policies is policies
+
+
+def test_is_permitted_many_matches_is_permitted():
+    pairs = [(feature, action)
+             for feature in [sec.PEOPLE, sec.TEXTS, 'no such feature']
+             for action in [sec.CREATE, sec.READ, sec.DELETE]]
+    kwargs = {sec.LOGIN_KEY: 'key'}
+    permitted = sec.is_permitted_many(sec.GOOD_USER_ID, pairs, **kwargs)
+    for feature, action in pairs:
+        assert permitted[feature][action] == sec.is_permitted(
+            feature, action, sec.GOOD_USER_ID, **kwargs)
+
+
+def test_is_permitted_many_runs_checks_once():
+    sec.read()
+    calls = []
+
+    def counting_check(user_id, **kwargs):
+        calls.append(user_id)
+        return True
+
+    policy = sec.Policy(checks=((sec.LOGIN, counting_check),))
+    with patch.dict(sec.policies, {(f'feature {i}', sec.CREATE): policy
+                                   for i in range(20)}):
+        permitted = sec.is_permitted_many(
+            'user', [(f'feature {i}', sec.CREATE) for i in range(20)])
+    assert all(actions[sec.CREATE] for actions in permitted.values())
+    assert len(calls) == 1
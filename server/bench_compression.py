@@ -0,0 +1,103 @@
+"""
+Benchmark response compression on a synthetic manuscript corpus.
+Serves /manuscript/read (whole and streamed) from an in-memory corpus,
+so the numbers measure serialization and compression, not the DB.
+Reports bytes on the wire and latency per encoding.
+
+    python -m server.bench_compression --size 10000 --rounds 5
+"""
+import argparse
+import random
+import statistics
+import time
+from unittest.mock import patch
+
+import data.manuscripts.manuscript as mt
+import server.compress as cmp
+import server.endpoints as ep
+
+IDENTITY = cmp.IDENTITY
+DEF_SIZE = 10_000
+DEF_ROUNDS = 5
+
+WORDS = ('api server journal manuscript referee editor review data model '
+         'result method abstract theory system network query index cache '
+         'latency throughput mongo flask endpoint schema').split()
+
+MANUSCRIPT_READ_EP = f'{ep.MANUSCRIPT_EP}/read'
+
+
+def make_text(rng, n_words: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(n_words)) + '.'
+
+
+def make_corpus(size: int, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    corpus = {}
+    for i in range(size):
+        title = f'Manuscript {i}: {make_text(rng, 5)}'
+        corpus[title] = {
+            mt.TITLE: title,
+            mt.AUTHOR: f'Author {rng.randrange(1000)}',
+            mt.AUTHOR_EMAIL: f'author{rng.randrange(1000)}@nyu.edu',
+            mt.EDITOR_EMAIL: f'editor{rng.randrange(50)}@nyu.edu',
+            mt.STATE: rng.choice(ep.MANUSCRIPT_STATES),
+            mt.ABSTRACT: make_text(rng, 60),
+            mt.TEXT: make_text(rng, 300),
+        }
+    return corpus
+
+
+def time_get(client, url: str, encoding: str, rounds: int) -> tuple:
+    """
+    Returns (bytes sent, median latency in ms).
+    """
+    headers = {'Accept-Encoding': encoding}
+    times = []
+    size = 0
+    for _ in range(rounds):
+        start = time.perf_counter()
+        resp = client.get(url, headers=headers)
+        size = len(resp.data)
+        times.append((time.perf_counter() - start) * 1000)
+    return size, statistics.median(times)
+
+
+def run(size: int, rounds: int) -> list:
+    corpus = make_corpus(size)
+    # No DB here, so skip the first-request index check.
+    ep.indexes_checked = True
+    client = ep.app.test_client()
+    results = []
+    with patch.object(mt, 'read', return_value=corpus), \
+            patch.object(mt, 'read_iter',
+                         side_effect=lambda: iter(corpus.items())):
+        for url in [MANUSCRIPT_READ_EP, f'{MANUSCRIPT_READ_EP}?stream=1']:
+            for encoding in [IDENTITY] + cmp.get_encodings():
+                n_bytes, latency = time_get(client, url, encoding, rounds)
+                results.append((url, encoding, n_bytes, latency))
+    return results
+
+
+def report(results: list):
+    plain = {url: n_bytes for url, encoding, n_bytes, _ in results
+             if encoding == IDENTITY}
+    print(f'{"url":<28} {"encoding":<9} {"bytes":>12} {"ratio":>6} '
+          f'{"ms":>9}')
+    for url, encoding, n_bytes, latency in results:
+        ratio = plain[url] / n_bytes if n_bytes else 0
+        print(f'{url:<28} {encoding:<9} {n_bytes:>12,} {ratio:>6.1f} '
+              f'{latency:>9.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--size', type=int, default=DEF_SIZE,
+                        help='number of manuscripts')
+    parser.add_argument('--rounds', type=int, default=DEF_ROUNDS)
+    args = parser.parse_args()
+    report(run(args.size, args.rounds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Negotiated response compression for the flask app.
+Clients that send Accept-Encoding get gzip, deflate or, where a zstd
+library is available, zstd. Small bodies go out as they are, and
+streamed (chunked) responses are compressed as they stream.
+"""
+import os
+import zlib
+
+from flask import request
+
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    zstd = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP = 'gzip'
+DEFLATE = 'deflate'
+ZSTD = 'zstd'
+IDENTITY = 'identity'
+
+# Bodies smaller than this are not worth compressing.
+MIN_SIZE_ENV = 'COMPRESS_MIN_SIZE'
+DEF_MIN_SIZE = 1024
+
+# gzip/deflate level: 3 gets most of level 6's ratio in half the time
+# (see bench_compression).
+COMPRESS_LEVEL = 3
+ZSTD_LEVEL = 3
+
+# While streaming, flush what we have compressed at least this often
+# (in bytes of input), so clients see steady progress.
+STREAM_FLUSH_SIZE = 64 * 1024
+
+COMPRESSIBLE_TYPES = {
+    'application/json',
+    'application/x-ndjson',
+    'application/javascript',
+    'application/xml',
+}
+
+# responses that must not have a body:
+NO_BODY_STATUSES = {204, 304}
+
+
+class ZlibStream:
+    """
+    gzip and deflate streams: wbits picks the wrapper.
+    """
+    def __init__(self, wbits: int):
+        self.obj = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, wbits)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self.obj.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self.obj.flush()
+
+
+class StdZstdStream:
+    def __init__(self):
+        self.obj = zstd.ZstdCompressor(level=ZSTD_LEVEL)
+
+    def compress(self, data: bytes) -> bytes:
+        return self.obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self.obj.flush(mode=zstd.ZstdCompressor.FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self.obj.flush()
+
+
+class ZstandardStream:
+    def __init__(self):
+        cctx = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        self.obj = cctx.compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self.obj.compress(data)
+
+    def flush(self) -> bytes:
+        return self.obj.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self.obj.flush()
+
+
+STREAMS = {
+    GZIP: lambda: ZlibStream(16 + zlib.MAX_WBITS),
+    DEFLATE: lambda: ZlibStream(zlib.MAX_WBITS),
+}
+if zstd is not None:
+    STREAMS[ZSTD] = StdZstdStream
+elif zstandard is not None:
+    STREAMS[ZSTD] = ZstandardStream
+
+# Our preference when the client accepts several equally.
+PREFERRED = [ZSTD, GZIP, DEFLATE]
+
+
+def get_encodings() -> list:
+    return [enc for enc in PREFERRED if enc in STREAMS]
+
+
+def get_min_size() -> int:
+    return int(os.environ.get(MIN_SIZE_ENV, DEF_MIN_SIZE))
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    stream = STREAMS[encoding]()
+    return stream.compress(data) + stream.finish()
+
+
+def compress_iter(chunks, encoding: str):
+    """
+    Compress an iterable of chunks as it is consumed.
+    """
+    stream = STREAMS[encoding]()
+    pending = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        out = stream.compress(chunk)
+        pending += len(chunk)
+        if pending >= STREAM_FLUSH_SIZE:
+            out += stream.flush()
+            pending = 0
+        if out:
+            yield out
+    yield stream.finish()
+
+
+def choose_encoding() -> str:
+    """
+    The client's most preferred encoding that we support, or None.
+    """
+    return request.accept_encodings.best_match(get_encodings())
+
+
+def is_compressible(response) -> bool:
+    if response.status_code in NO_BODY_STATUSES:
+        return False
+    if response.status_code < 200 or request.method == 'HEAD':
+        return False
+    if response.direct_passthrough:
+        return False
+    if response.headers.get('Content-Encoding', IDENTITY) != IDENTITY:
+        return False
+    mimetype = response.mimetype or ''
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+
+def compress_response(response):
+    """
+    after_request hook: compress the body if the client accepts it.
+    """
+    if not is_compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+    if response.is_streamed:
+        response.response = compress_iter(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < get_min_size():
+            return response
+        response.set_data(compress(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    # The compressed bytes differ from the plain ones, so a strong tag
+    # would be wrong: downgrade it to weak.
+    etag, is_weak = response.get_etag()
+    if etag and not is_weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_app(app):
+    app.after_request(compress_response)
@@ -3,7 +3,19 @@ This is the file containing all of the endpoints for our flask app.
 The endpoint called `endpoints` will return all available endpoints.
 """
 
-from flask import Flask, request
+import base64
+import binascii
+import hashlib
+import json
+
+from flask import (
+    Flask,
+    Response,
+    g,
+    has_request_context,
+    request,
+    stream_with_context,
+)
 from flask_cors import CORS
 from flask_restx import Api, Resource, fields
 from http import HTTPStatus
@@ -11,7 +23,13 @@ import werkzeug.exceptions as wz
 import security.security as sec
 from werkzeug.utils import secure_filename
 import os
+import server.compress as cmp
+import server.page_cache as pgc
+import server.serialize as ser
+import data.db_connect as dbc
+import data.indexes as idx
 import data.people as ppl
+import data.people_import as pim
 import data.text as txt
 import data.manuscripts.manuscript as mt
 import data.manuscripts.query as qy
@@ -25,6 +43,41 @@ from data.roles import (
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
 api = Api(app)
+cmp.init_app(app)
+ser.init_api(api)
+
+indexes_checked = False
+
+
+@app.before_request
+def check_indexes():
+    """
+    Verify (or create, per INDEX_CHECK) the required DB indexes once
+    per process. We connect lazily, so the first request is our startup.
+    The flag is only set once the check passes: with INDEX_CHECK=fail,
+    every request fails until the indexes exist.
+    """
+    global indexes_checked
+    if not indexes_checked:
+        idx.check()
+        indexes_checked = True
+
+
+def request_identity_map():
+    """
+    The identity map for the current request, so a request that looks
+    at the same doc several times only fetches it once.
+    """
+    if not has_request_context():
+        return None
+    if "identity_map" not in g:
+        g.identity_map = {}
+    return g.identity_map
+
+
+dbc.set_identity_map_provider(request_identity_map)
+txt.add_reload_listener(pgc.rebuild)
+
 
 ENDPOINT_EP = "/endpoints"
 HELLO_EP = "/hello"
@@ -110,6 +163,19 @@ MANUSCRIPT_STATES = [
     MANUSCRIPT_STATE_PUBLISHED,
 ]
 
+# Streaming responses: one JSON record per line.
+NDJSON = "application/x-ndjson"
+JSON = "application/json"
+STREAM_PARAM = "stream"
+STREAM_ON = {"1", "true", "yes"}
+
+# Keyset pagination.
+LIMIT_PARAM = "limit"
+CURSOR_PARAM = "cursor"
+NEXT_CURSOR = "next_cursor"
+DEFAULT_PAGE_LIMIT = 25
+MAX_PAGE_LIMIT = 100
+
 # File upload configuration
 UPLOAD_FOLDER = os.path.join(os.getcwd(), "uploads")
 ALLOWED_EXTENSIONS = {"pdf", "doc", "docx"}
@@ -123,6 +189,129 @@ def allowed_file(filename):
     )
 
 
+def wants_stream() -> bool:
+    """
+    Clients opt in to streaming with ?stream=1 or by asking for NDJSON.
+    """
+    if request.args.get(STREAM_PARAM, "").lower() in STREAM_ON:
+        return True
+    return request.accept_mimetypes.best_match([JSON, NDJSON]) == NDJSON
+
+
+def ndjson_response(recs) -> Response:
+    """
+    Write each record on its own line as it comes off the cursor,
+    so peak memory stays flat whatever the collection size.
+    """
+    def generate():
+        for rec in recs:
+            yield ser.dumps(rec) + b"\n"
+    return Response(stream_with_context(generate()), mimetype=NDJSON)
+
+
+def encode_cursor(after) -> str:
+    """
+    Continuation tokens are opaque to clients: the last key seen,
+    JSON-encoded and base64'd.
+    """
+    if after is None:
+        return None
+    raw = json.dumps(after).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(token: str):
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (binascii.Error, ValueError):
+        raise wz.BadRequest(f"Bad cursor: {token}")
+
+
+def get_page_args():
+    """
+    Returns (limit, after) if the client asked for a page,
+    or None if it wants the whole collection.
+    """
+    if LIMIT_PARAM not in request.args and CURSOR_PARAM not in request.args:
+        return None
+    try:
+        limit = int(request.args.get(LIMIT_PARAM, DEFAULT_PAGE_LIMIT))
+    except ValueError:
+        raise wz.BadRequest(f"Bad {LIMIT_PARAM}")
+    if limit < 1:
+        raise wz.BadRequest(f"{LIMIT_PARAM} must be positive")
+    limit = min(limit, MAX_PAGE_LIMIT)
+    after = None
+    if request.args.get(CURSOR_PARAM):
+        after = decode_cursor(request.args[CURSOR_PARAM])
+    return limit, after
+
+
+def make_etag(*parts) -> str:
+    """
+    A tag built from whatever identifies a response's content: a
+    version number or the content itself. The query string is mixed
+    in since it picks the view (page, role type, ...).
+    """
+    raw = repr((parts, request.query_string)).encode()
+    return hashlib.sha1(raw).hexdigest()
+
+
+def content_etag(payload) -> str:
+    return make_etag(json.dumps(payload, sort_keys=True))
+
+
+def conditional_response(etag: str, build):
+    """
+    Conditional GET: if the client already holds this version, answer
+    304 with no body. The comparison is weak, as compression turns our
+    tags weak. build() is only called to make a full response,
+    so a matching poll costs neither a full read nor serialization.
+    """
+    if request.if_none_match.contains_weak(etag):
+        resp = Response(status=HTTPStatus.NOT_MODIFIED)
+    else:
+        resp = api.make_response(build(), HTTPStatus.OK)
+    resp.set_etag(etag)
+    return resp
+
+
+def rendered_response(page: pgc.RenderedPage) -> Response:
+    """
+    Send a pre-rendered page as it is: gzipped if the client takes
+    gzip and we have it, plain otherwise.
+    """
+    if request.if_none_match.contains_weak(page.etag):
+        resp = Response(status=HTTPStatus.NOT_MODIFIED)
+        resp.set_etag(page.etag)
+    elif page.gzipped and request.accept_encodings.best_match([cmp.GZIP]):
+        resp = Response(page.gzipped, mimetype=JSON)
+        resp.headers["Content-Encoding"] = cmp.GZIP
+        resp.set_etag(page.etag, weak=True)
+    else:
+        resp = Response(page.body, mimetype=JSON)
+        resp.set_etag(page.etag)
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+
+# key -> (etag, payload) for responses that can't
+# change while the process runs.
+static_responses = {}
+
+
+def static_response(key: str, build):
+    """
+    Build and tag a fixed payload once per process.
+    key must come from a small, fixed set, as it stays in memory.
+    """
+    if key not in static_responses:
+        payload = build()
+        static_responses[key] = (content_etag(payload), payload)
+    etag, payload = static_responses[key]
+    return conditional_response(etag, lambda: payload)
+
+
 @api.route(HELLO_EP)
 class HelloWorld(Resource):
     def get(self):
@@ -132,8 +321,11 @@ class HelloWorld(Resource):
 @api.route(ENDPOINT_EP)
 class Endpoints(Resource):
     def get(self):
-        endpoints = sorted(rule.rule for rule in api.app.url_map.iter_rules())
-        return {"Available endpoints": endpoints}
+        return static_response(ENDPOINT_EP, lambda: {
+            "Available endpoints": sorted(
+                rule.rule for rule in api.app.url_map.iter_rules()
+            ),
+        })
 
 
 @api.route(TITLE_EP)
@@ -147,6 +339,14 @@ class People(Resource):
     @api.response(HTTPStatus.OK, "Success")
     @api.response(HTTPStatus.NOT_FOUND, "Person not found")
     def get(self):
+        if wants_stream():
+            return ndjson_response(
+                person for _email, person in ppl.read_iter()
+            )
+        page_args = get_page_args()
+        if page_args:
+            people, next_after = ppl.read_page(*page_args)
+            return {"data": people, NEXT_CURSOR: encode_cursor(next_after)}
         try:
             people = ppl.read()
             return people, HTTPStatus.OK
@@ -222,13 +422,52 @@ class People(Resource):
         return {"message": "Person not found"}, HTTPStatus.NOT_FOUND
 
 
+@api.route(f"{PEOPLE_EP}/import")
+class PeopleImport(Resource):
+    @api.doc(params={
+        "format": f"One of {pim.FORMATS}; defaults from Content-Type",
+        "user_id": "Who is importing",
+        "login_key": "Their login key",
+    })
+    @api.response(HTTPStatus.OK, "One NDJSON result line per input row")
+    @api.response(HTTPStatus.FORBIDDEN, "Permission denied")
+    def post(self):
+        """
+        Bulk import people from a CSV or JSON-lines request body.
+        The body is read and imported a chunk at a time, and the
+        per-row results are streamed back as they are ready.
+        """
+        if not sec.is_permitted(
+            "people", "create", request.args.get("user_id"),
+            login_key=request.args.get("login_key"),
+        ):
+            return {"message": "Permission denied"}, HTTPStatus.FORBIDDEN
+        fmt = request.args.get("format")
+        if fmt is None:
+            fmt = (pim.CSV if request.mimetype == "text/csv"
+                   else pim.JSON_LINES)
+        if fmt not in pim.FORMATS:
+            return (
+                {"message": f"Unknown format: {fmt}"},
+                HTTPStatus.BAD_REQUEST,
+            )
+        lines = (line.decode("utf-8") for line in request.stream)
+        return ndjson_response(pim.import_people(pim.parse(lines, fmt)))
+
+
 @api.route(TEXT_EP)
 class Texts(Resource):
     @api.response(HTTPStatus.OK, "Success")
     def get(self):
         try:
+            # Version first: should a reload land in between, we
+            # render newer pages under an older version, which no one
+            # will ask for again, rather than the other way around.
+            version = txt.get_version()
             texts = txt.read()
-            return texts, HTTPStatus.OK
+            return rendered_response(
+                pgc.get_page(pgc.ALL_PAGES, version, texts)
+            )
         except Exception as e:
             return {"message": str(e)}, HTTPStatus.INTERNAL_SERVER_ERROR
 
@@ -328,51 +567,119 @@ class TextEntry(Resource):
             return {"message": "Text entry not found"}, HTTPStatus.NOT_FOUND
 
 
+@api.route(f"{TEXT_EP}/<key>")
+class TextPage(Resource):
+    @api.response(HTTPStatus.OK, "Success")
+    @api.response(HTTPStatus.NOT_FOUND, "Text entry not found")
+    def get(self, key):
+        """
+        One text page, served from the rendered-page cache.
+        """
+        version = txt.get_version()
+        page = txt.read_one(key)
+        if not page:
+            return {"message": "Text entry not found"}, HTTPStatus.NOT_FOUND
+        return rendered_response(pgc.get_page(key, version, page))
+
+
 MASTHEAD = "Masthead"
 
 
 @api.route(f"{PEOPLE_EP}/masthead")
 class Masthead(Resource):
     def get(self):
-        return {MASTHEAD: ppl.get_masthead()}
+        mh_doc = ppl.read_masthead_doc()
+        return conditional_response(
+            make_etag(MASTHEAD, ppl.get_masthead_tag(mh_doc)),
+            lambda: {MASTHEAD: ppl.read_masthead(mh_doc)},
+        )
 
 
 @api.route(f"{MANUSCRIPT_EP}/read")
 class Manuscripts(Resource):
     def get(self):
+        if wants_stream():
+            return ndjson_response(manu for _title, manu in mt.read_iter())
+        page_args = get_page_args()
+        if page_args:
+            manuscripts, next_after = mt.read_page(*page_args)
+            return {
+                "data": manuscripts,
+                NEXT_CURSOR: encode_cursor(next_after),
+            }
         return mt.read()
 
 
+def get_state_info(manuscript: dict, actions_by_state: dict) -> dict:
+    """
+    A manuscript's current state and the actions available from it.
+    actions_by_state memoizes the action list per distinct state, so a
+    listing does one lookup per state rather than per manuscript.
+    """
+    current_state = manuscript.get(mt.STATE, "")
+    if current_state not in actions_by_state:
+        actions_by_state[current_state] = list(
+            qy.get_valid_actions_by_state(current_state)
+        )
+    available_actions = actions_by_state[current_state]
+    return {
+        "current_state": current_state,
+        "available_actions": available_actions,
+        "_links": {
+            "update_state": {
+                "href": f"{MANUSCRIPT_EP}/update_state",
+                "method": "PUT",
+                "description": "Update manuscript state",
+            }
+        },
+    }
+
+
 @api.route(f"{MANUSCRIPT_EP}/states")
 class ManuscriptStates(Resource):
     def get(self):
-        # Get all manuscripts
-        manuscripts = mt.read()
+        actions_by_state = {}
+        if wants_stream():
+            return ndjson_response(
+                {mt.TITLE: title,
+                 **get_state_info(manuscript, actions_by_state)}
+                for title, manuscript in mt.read_iter(
+                    projection=mt.STATE_FIELDS
+                )
+            )
 
-        # For each manuscript, get its current state and available actions
-        state_info = {}
+        page_args = get_page_args()
 
-        for title, manuscript in manuscripts.items():
-            current_state = manuscript.get(mt.STATE, "")
-            available_actions = list(
-                qy.get_valid_actions_by_state(current_state)
-            )
-            state_info[title] = {
-                "current_state": current_state,
-                "available_actions": available_actions,
-                "_links": {
-                    "update_state": {
-                        "href": f"{MANUSCRIPT_EP}/update_state",
-                        "method": "PUT",
-                        "description": "Update manuscript state",
-                    }
-                },
-            }
+        def build():
+            next_after = None
+            if page_args:
+                manuscripts, next_after = mt.read_page(
+                    *page_args, projection=mt.STATE_FIELDS
+                )
+            else:
+                # Get all manuscripts
+                manuscripts = mt.read(projection=mt.STATE_FIELDS)
 
-        return {
-            "states": MANUSCRIPT_STATES,
-            "manuscripts": state_info,
-        }
+            # For each manuscript, get its current state and actions
+            state_info = {}
+
+            for title, manuscript in manuscripts.items():
+                state_info[title] = get_state_info(manuscript,
+                                                   actions_by_state)
+
+            ret = {
+                "states": MANUSCRIPT_STATES,
+                "manuscripts": state_info,
+            }
+            if page_args:
+                ret[NEXT_CURSOR] = encode_cursor(next_after)
+            return ret
+
+        # Tagged with the collection version, so an unchanged listing
+        # is answered without reading any manuscripts.
+        return conditional_response(
+            make_etag("states", mt.get_version()), build
+        )
 
 
 manuscript_model = api.model(
@@ -490,15 +797,6 @@ class ManuscriptUpdate(Resource):
                 HTTPStatus.BAD_REQUEST,
             )
 
-        if not mt.exists(title):
-            return (
-                {
-                    "message": f"Manuscript '{title}' does not exist.",
-                    "return": None,
-                },
-                HTTPStatus.NOT_FOUND,
-            )
-
         updates = {
             mt.AUTHOR: request.form.get("author"),
             mt.AUTHOR_EMAIL: request.form.get("author_email"),
@@ -584,7 +882,9 @@ class ManuscriptUpdateState(Resource):
                 kwargs["ref"] = data.get(mt.REFEREES)
 
             mt.update_state(title, data.get(mt.ACTION), **kwargs)
-            updated = mt.read_one(title)
+            updated = mt.read_one(
+                title, projection={mt.STATE: 1, mt.HISTORY: 1}
+            )
 
             return (
                 {
@@ -603,6 +903,112 @@ class ManuscriptUpdateState(Resource):
             )
 
 
+MAX_BULK_ACTIONS = 500
+ACTIONS = "actions"
+
+bulk_action_model = api.model(
+    "BulkAction",
+    {
+        ACTIONS: fields.List(
+            fields.Raw(
+                example={
+                    mt.TITLE: "Some title",
+                    mt.ACTION: qy.REJECT,
+                    mt.KWARGS: {},
+                }
+            ),
+            required=True,
+            description="(title, action, kwargs) items to apply",
+        ),
+    },
+)
+
+
+@api.route(f"{MANUSCRIPT_EP}/bulk_action")
+class ManuscriptBulkAction(Resource):
+    @api.expect(bulk_action_model)
+    @api.response(HTTPStatus.OK, "Actions processed; see per-item results")
+    @api.response(HTTPStatus.BAD_REQUEST, "No actions or too many")
+    def put(self):
+        items = (request.json or {}).get(ACTIONS)
+        if not items or not isinstance(items, list):
+            return (
+                {MESSAGE: "A list of actions is required"},
+                HTTPStatus.BAD_REQUEST,
+            )
+        if len(items) > MAX_BULK_ACTIONS:
+            return {
+                MESSAGE: f"At most {MAX_BULK_ACTIONS} actions per request"
+            }, HTTPStatus.BAD_REQUEST
+        if not all(isinstance(item, dict) for item in items):
+            return (
+                {MESSAGE: "Each action must be an object"},
+                HTTPStatus.BAD_REQUEST,
+            )
+        return mt.bulk_update_state(items), HTTPStatus.OK
+
+
+MAX_PERMISSION_CHECKS = 100
+CHECKS = "checks"
+FEATURE = "feature"
+ACTION = "action"
+
+permissions_model = api.model(
+    "Permissions",
+    {
+        "user_id": fields.String(required=True),
+        "login_key": fields.String(required=False),
+        CHECKS: fields.List(
+            fields.Raw(example={FEATURE: sec.PEOPLE, ACTION: sec.CREATE}),
+            required=True,
+            description="(feature, action) pairs to evaluate",
+        ),
+    },
+)
+
+
+@api.route("/permissions")
+class Permissions(Resource):
+    @api.expect(permissions_model)
+    @api.response(HTTPStatus.OK, "{feature: {action: allowed}}")
+    @api.response(HTTPStatus.BAD_REQUEST, "No checks or too many")
+    def post(self):
+        """
+        Which of a batch of (feature, action) pairs may this user do?
+        Lets a client decide which controls to show in one call.
+        """
+        data = request.json or {}
+        checks = data.get(CHECKS)
+        if not checks or not isinstance(checks, list):
+            return (
+                {MESSAGE: "A list of checks is required"},
+                HTTPStatus.BAD_REQUEST,
+            )
+        if len(checks) > MAX_PERMISSION_CHECKS:
+            return {
+                MESSAGE: f"At most {MAX_PERMISSION_CHECKS} checks per request"
+            }, HTTPStatus.BAD_REQUEST
+        try:
+            pairs = [(check[FEATURE], check[ACTION]) for check in checks]
+        except (KeyError, TypeError):
+            return (
+                {MESSAGE: f"Each check needs a {FEATURE} and an {ACTION}"},
+                HTTPStatus.BAD_REQUEST,
+            )
+        if not all(isinstance(name, str) for pair in pairs for name in pair):
+            return (
+                {MESSAGE: f"{FEATURE} and {ACTION} must be strings"},
+                HTTPStatus.BAD_REQUEST,
+            )
+        # Only pass the key if we got one: a missing key must fail checks.
+        kwargs = {}
+        if data.get(sec.LOGIN_KEY) is not None:
+            kwargs[sec.LOGIN_KEY] = data[sec.LOGIN_KEY]
+        return sec.is_permitted_many(
+            data.get("user_id"), pairs, **kwargs,
+        ), HTTPStatus.OK
+
+
 @api.route("/register")
 class Register(Resource):
     @api.expect(register_model)
@@ -667,13 +1073,21 @@ class Roles(Resource):
         role_type = request.args.get("type")
 
         if role_type == "codes":
-            return {"data": {"role_codes": get_role_codes()}}
+            return static_response("roles codes", lambda: {
+                "data": {"role_codes": get_role_codes()}
+            })
         if role_type == "descriptions":
-            return {"data": {"role_descriptions": get_role_descriptions()}}
+            return static_response("roles descriptions", lambda: {
+                "data": {"role_descriptions": get_role_descriptions()}
+            })
         if role_type == "masthead":
-            return {"data": {"masthead_roles": get_masthead_roles()}}
+            return static_response("roles masthead", lambda: {
+                "data": {"masthead_roles": get_masthead_roles()}
+            })
 
-        return {"data": {"roles": get_roles()}}
+        return static_response("roles", lambda: {
+            "data": {"roles": get_roles()}
+        })
 
 
 @api.route("/users")
@@ -685,7 +1099,7 @@ class Users(Resource):
         if not email:
             return {"message": "Email is required"}, HTTPStatus.BAD_REQUEST
 
-        user = ppl.get_user_by_email(email)
+        user = ppl.get_user_by_email(email, projection=ppl.USER_SUMMARY)
         if user:
             return {
                 "email": user["email"],
@@ -695,18 +1109,28 @@ class Users(Resource):
             return {"message": "User not found"}, HTTPStatus.NOT_FOUND
 
 
+EDITOR_ROLES = {"editor", "consulting editor", "managing editor"}
+
+
 @api.route("/editors")
 class Editors(Resource):
     @api.response(HTTPStatus.OK, "List of editors retrieved successfully")
     def get(self):
+        page_args = get_page_args()
+        if page_args:
+            editors, next_after = ppl.read_users_page(*page_args,
+                                                      roles=EDITOR_ROLES)
+            return {
+                "editors": list(editors),
+                NEXT_CURSOR: encode_cursor(next_after),
+            }, HTTPStatus.OK
         try:
-            all_users = ppl.read_users()
-            editor_roles = {"editor", "consulting editor", "managing editor"}
+            all_users = ppl.read_users(projection=ppl.USER_SUMMARY)
             editor_emails = []
 
             for user in all_users.values():
                 role = user.get("role", "").lower()
-                if role in editor_roles:
+                if role in EDITOR_ROLES:
                     editor_emails.append(user["email"])
 
             return {"editors": editor_emails}, HTTPStatus.OK
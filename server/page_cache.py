@@ -0,0 +1,54 @@
+"""
+Ready-to-send text page responses.
+Each page is serialized and gzipped once per text version, so serving
+one is just handing over bytes: no JSON encoding or compression per
+request. data.text tells us whenever it (re)loads its pages, and we
+render them all again then.
+"""
+import hashlib
+
+import server.compress as cmp
+import server.serialize as ser
+
+# The key under which we keep the response for all pages at once.
+ALL_PAGES = None
+
+
+class RenderedPage:
+    def __init__(self, payload, tag: str):
+        self.body = ser.dumps(payload)
+        gzipped = cmp.compress(self.body, cmp.GZIP)
+        # Tiny bodies can come out bigger; then we don't keep them.
+        self.gzipped = gzipped if len(gzipped) < len(self.body) else None
+        self.etag = hashlib.sha1(tag.encode()).hexdigest()
+
+
+# (page key, text version) -> RenderedPage, for the current version.
+rendered = {}
+
+
+def render(key, version, payload) -> RenderedPage:
+    return RenderedPage(payload, f'{key}-{version}')
+
+
+def rebuild(texts: dict, version):
+    """
+    Render every page, and the whole set, for this version.
+    Swapped in whole, so readers never see a half-built cache.
+    """
+    global rendered
+    pages = {(ALL_PAGES, version): render(ALL_PAGES, version, texts)}
+    for key, page in texts.items():
+        pages[(key, version)] = render(key, version, page)
+    rendered = pages
+
+
+def get_page(key, version, payload) -> RenderedPage:
+    """
+    The rendered page, rendering it now if we haven't yet.
+    """
+    page = rendered.get((key, version))
+    if page is None:
+        page = render(key, version, payload)
+        rendered[(key, version)] = page
+    return page
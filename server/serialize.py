@@ -0,0 +1,60 @@
+"""
+Fast JSON output for the API.
+Uses orjson when it is installed and the stdlib json module otherwise.
+Both write ObjectIds as strings and dates as ISO 8601, so the data
+layer can hand us raw Mongo docs.
+"""
+import datetime
+import json
+
+from bson import ObjectId
+from flask import make_response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON = 'application/json'
+
+
+def default(obj):
+    """
+    Encode the types neither encoder knows about.
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f'Cannot serialize {type(obj).__name__} to JSON')
+
+
+def std_dumps(data) -> bytes:
+    return json.dumps(data, default=default).encode()
+
+
+def dumps(data) -> bytes:
+    if orjson is None:
+        return std_dumps(data)
+    try:
+        return orjson.dumps(data, default=default,
+                            option=orjson.OPT_NON_STR_KEYS)
+    except orjson.JSONEncodeError:
+        # e.g. ints too big for orjson: the stdlib copes.
+        return std_dumps(data)
+
+
+def output_json(data, code, headers=None):
+    """
+    flask-restx representation for application/json.
+    """
+    resp = make_response(dumps(data), code)
+    resp.headers.extend(headers or {})
+    resp.mimetype = JSON
+    return resp
+
+
+def init_api(api):
+    api.representation(JSON)(output_json)
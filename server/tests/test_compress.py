@@ -0,0 +1,94 @@
+import gzip
+import json
+import zlib
+from http.client import NOT_MODIFIED, OK
+from unittest.mock import patch
+
+import pytest
+
+import server.compress as cmp
+import server.endpoints as ep
+
+TEST_CLIENT = ep.app.test_client()
+
+BIG_MANUSCRIPTS = {
+    f'Title {i}': {'title': f'Title {i}', 'text': 'Lorem ipsum. ' * 50}
+    for i in range(50)
+}
+
+MANUSCRIPT_READ_EP = f'{ep.MANUSCRIPT_EP}/read'
+
+
+def get_big(encoding: str):
+    with patch('data.manuscripts.manuscript.read',
+               return_value=BIG_MANUSCRIPTS):
+        return TEST_CLIENT.get(MANUSCRIPT_READ_EP,
+                               headers={'Accept-Encoding': encoding})
+
+
+def test_gzip():
+    resp = get_big(cmp.GZIP)
+    assert resp.status_code == OK
+    assert resp.headers['Content-Encoding'] == cmp.GZIP
+    assert 'Accept-Encoding' in resp.headers['Vary']
+    body = gzip.decompress(resp.data)
+    assert json.loads(body) == BIG_MANUSCRIPTS
+    assert len(resp.data) < len(body)
+
+
+def test_deflate():
+    resp = get_big(cmp.DEFLATE)
+    assert resp.headers['Content-Encoding'] == cmp.DEFLATE
+    assert json.loads(zlib.decompress(resp.data)) == BIG_MANUSCRIPTS
+
+
+def test_preference():
+    resp = get_big('deflate;q=0.5, gzip')
+    assert resp.headers['Content-Encoding'] == cmp.GZIP
+
+
+@pytest.mark.parametrize('encoding', ['', 'br', 'gzip;q=0'])
+def test_no_acceptable_encoding(encoding):
+    resp = get_big(encoding)
+    assert 'Content-Encoding' not in resp.headers
+    assert resp.get_json() == BIG_MANUSCRIPTS
+
+
+def test_small_body_not_compressed():
+    resp = TEST_CLIENT.get(ep.HELLO_EP, headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in resp.headers
+    assert resp.get_json() == {ep.HELLO_RESP: 'world'}
+
+
+def test_streamed():
+    people = [{'email': f'p{i}@nyu.edu', 'name': f'Person {i}'}
+              for i in range(500)]
+    with patch('data.people.read_iter',
+               return_value=iter((p['email'], p) for p in people)):
+        resp = TEST_CLIENT.get(f'{ep.PEOPLE_EP}?stream=1',
+                               headers={'Accept-Encoding': 'gzip'})
+    assert resp.headers['Content-Encoding'] == cmp.GZIP
+    assert 'Content-Length' not in resp.headers
+    lines = gzip.decompress(resp.data).decode().splitlines()
+    assert [json.loads(line) for line in lines] == people
+
+
+def test_compress_iter_flushes():
+    chunks = [b'x' * 100] * 10
+    with patch.object(cmp, 'STREAM_FLUSH_SIZE', 250):
+        parts = list(cmp.compress_iter(chunks, cmp.GZIP))
+    assert len(parts) > 2
+    assert gzip.decompress(b''.join(parts)) == b''.join(chunks)
+
+
+@patch.dict('os.environ', {cmp.MIN_SIZE_ENV: '0'})
+def test_etag_weak_when_compressed():
+    first = TEST_CLIENT.get(ep.ENDPOINT_EP,
+                            headers={'Accept-Encoding': 'gzip'})
+    assert first.headers['Content-Encoding'] == cmp.GZIP
+    assert first.headers['ETag'].startswith('W/')
+    second = TEST_CLIENT.get(ep.ENDPOINT_EP, headers={
+        'Accept-Encoding': 'gzip',
+        'If-None-Match': first.headers['ETag'],
+    })
+    assert second.status_code == NOT_MODIFIED
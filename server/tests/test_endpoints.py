@@ -4,6 +4,7 @@ from http.client import (
     FORBIDDEN,
     NOT_ACCEPTABLE,
     NOT_FOUND,
+    NOT_MODIFIED,
     OK,
     SERVICE_UNAVAILABLE,
 )
@@ -11,7 +12,10 @@ from http.client import (
 from unittest.mock import patch
 from data.people import NAME
 import data.manuscripts.manuscript as mt
+import data.db_connect as dbc
 import data.people as ppl
+import data.text as txt
+import security.security as sec
 
 import pytest
 import json
@@ -33,6 +37,18 @@ def test_hello_with_patch():
     resp_json = resp.get_json()
     assert "Hello, patched response!" in resp_json
 
+
+@patch('server.endpoints.indexes_checked', False)
+@patch('data.indexes.check', autospec=True,
+       side_effect=RuntimeError('Missing indexes'))
+def test_check_indexes_keeps_failing(mock_check):
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            ep.check_indexes()
+    assert mock_check.call_count == 2
+    assert not ep.indexes_checked
+
+
 def test_hello():
     resp = TEST_CLIENT.get(ep.HELLO_EP)
     resp_json = resp.get_json()
@@ -294,7 +310,13 @@ def test_update(mock_update):
     )
 
 
+def remove_text(key):
+    if txt.read_one(key):
+        txt.delete_text(key)
+
+
 def test_create_text():
+    remove_text("001")
     text_data = {
         "key": "001",
         "title": "Ocean Exploration",
@@ -332,6 +354,7 @@ def test_create_duplicate_text():
     assert 'already exists' in resp.get_json()['message']
 
 def test_delete_text():
+    remove_text("delete_test")
     text_data = {
         "key": "delete_test",
         "title": "Delete Test",
@@ -364,6 +387,7 @@ def test_delete_text():
     assert delete_again_resp.get_json()['message'] == 'Text entry not found'
 
 def test_update_text():
+    remove_text("update_test")
     # Initial text data
     text_data = {
         "key": "update_test",
@@ -409,8 +433,8 @@ def test_endpoints(test_client):
     assert len(resp_json["Available endpoints"]) > 0
 
 
-@patch('data.people.get_masthead', autospec=True, return_value={})
-def test_get_masthead(mock_get_masthead):
+@patch('data.people.read_masthead', autospec=True, return_value={})
+def test_get_masthead(mock_read_masthead):
     resp = TEST_CLIENT.get(f'{ep.PEOPLE_EP}/masthead')
     assert resp.status_code == OK
     resp_json = resp.get_json()
@@ -677,3 +701,233 @@ def test_receive_action_endpoint(mock_handle_action):
 
     # Cleanup: delete the test manuscript
     mt.delete(title)
+
+
+STREAM_PEOPLE = [
+    ('a@nyu.edu', {NAME: 'A', ppl.EMAIL: 'a@nyu.edu'}),
+    ('b@nyu.edu', {NAME: 'B', ppl.EMAIL: 'b@nyu.edu'}),
+]
+
+
+@patch('data.people.read_iter', autospec=True,
+       return_value=iter(STREAM_PEOPLE))
+def test_read_people_stream(mock_read_iter):
+    resp = TEST_CLIENT.get(f'{ep.PEOPLE_EP}?stream=1')
+    assert resp.status_code == OK
+    assert resp.mimetype == ep.NDJSON
+    lines = resp.get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] \
+        == [person for _email, person in STREAM_PEOPLE]
+
+
+@patch('data.manuscripts.manuscript.read_iter', autospec=True,
+       return_value=iter([('T1', {mt.TITLE: 'T1', mt.STATE: 'SUB'})]))
+def test_manuscript_states_stream(mock_read_iter):
+    resp = TEST_CLIENT.get(f'{MANUSCRIPT_EP}/states',
+                           headers={'Accept': ep.NDJSON})
+    assert resp.status_code == OK
+    assert resp.mimetype == ep.NDJSON
+    recs = [json.loads(line)
+            for line in resp.get_data(as_text=True).splitlines()]
+    assert recs[0][mt.TITLE] == 'T1'
+    assert recs[0]['current_state'] == 'SUB'
+    assert 'REJ' in recs[0]['available_actions']
+
+
+@patch('data.people.read_page', autospec=True,
+       return_value=({'a@nyu.edu': {NAME: 'A'}}, 'a@nyu.edu'))
+def test_read_people_page(mock_read_page):
+    resp = TEST_CLIENT.get(f'{ep.PEOPLE_EP}?limit=1000')
+    assert resp.status_code == OK
+    resp_json = resp.get_json()
+    assert 'a@nyu.edu' in resp_json['data']
+    mock_read_page.assert_called_once_with(ep.MAX_PAGE_LIMIT, None)
+    token = resp_json[ep.NEXT_CURSOR]
+    TEST_CLIENT.get(f'{ep.PEOPLE_EP}?limit=1&cursor={token}')
+    mock_read_page.assert_called_with(1, 'a@nyu.edu')
+
+
+def test_read_people_bad_cursor():
+    resp = TEST_CLIENT.get(f'{ep.PEOPLE_EP}?cursor=!!!')
+    assert resp.status_code == BAD_REQUEST
+
+
+def test_read_people_bad_limit():
+    resp = TEST_CLIENT.get(f'{ep.PEOPLE_EP}?limit=0')
+    assert resp.status_code == BAD_REQUEST
+
+
+@patch('data.manuscripts.manuscript.bulk_update_state', autospec=True,
+       return_value={mt.RESULTS: [], mt.CONFLICTS: 0})
+def test_bulk_action(mock_bulk):
+    items = [{mt.TITLE: 'T', mt.ACTION: 'REJ'}]
+    resp = TEST_CLIENT.put(f'{MANUSCRIPT_EP}/bulk_action',
+                           json={ep.ACTIONS: items})
+    assert resp.status_code == OK
+    mock_bulk.assert_called_once_with(items)
+
+
+def test_bulk_action_empty():
+    resp = TEST_CLIENT.put(f'{MANUSCRIPT_EP}/bulk_action',
+                           json={ep.ACTIONS: []})
+    assert resp.status_code == BAD_REQUEST
+
+
+def test_bulk_action_title_not_string():
+    resp = TEST_CLIENT.put(f'{MANUSCRIPT_EP}/bulk_action',
+                           json={ep.ACTIONS: [{mt.TITLE: {'$ne': None},
+                                               mt.ACTION: 'REJ'}]})
+    assert resp.status_code == OK
+    assert resp.get_json()[mt.RESULTS][0][mt.OK] is False
+
+
+def test_manuscript_update_not_found():
+    response = TEST_CLIENT.put(
+        f'{MANUSCRIPT_EP}/update',
+        data={mt.TITLE: 'No Such Manuscript', mt.AUTHOR: 'Nobody'},
+        content_type='multipart/form-data'
+    )
+    assert response.status_code == NOT_FOUND
+
+
+def test_people_import():
+    email = 'endpoint_import@nyu.edu'
+    ppl.delete_person(email)
+    body = f'{{"name": "Endpoint Import", "email": "{email}"}}\n'
+    resp = TEST_CLIENT.post(f'{ep.PEOPLE_EP}/import?login_key=valid',
+                            data=body, content_type=ep.NDJSON)
+    assert resp.status_code == OK
+    results = [json.loads(line)
+               for line in resp.get_data(as_text=True).splitlines()]
+    assert results[0]['status'] == 'created'
+    assert ppl.exists(email)
+    ppl.delete_person(email)
+
+
+def count_reads(method, url, **kwargs):
+    """
+    Make a request and return how many one-doc reads got past the
+    identity map.
+    """
+    with patch.object(dbc.read_cache, 'read_through',
+                      wraps=dbc.read_cache.read_through) as reads:
+        resp = getattr(TEST_CLIENT, method)(url, **kwargs)
+    assert resp.status_code == OK, resp.get_json()
+    return reads.call_count
+
+
+def test_delete_manuscript_reads_once():
+    title = 'Identity Map Delete'
+    for provider in [None, ep.request_identity_map]:
+        mt.create(title, 'Author', TEST_EMAIL, 'Text', 'Abstract',
+                  TEST_EMAIL)
+        with patch.object(dbc, 'identity_map_provider', provider):
+            reads = count_reads('delete', f'{MANUSCRIPT_EP}/delete',
+                                json={mt.TITLE: title})
+        if provider is None:
+            assert reads == 2
+        else:
+            assert reads == 1
+
+
+def test_identity_map_dropped_on_write():
+    with ep.app.test_request_context():
+        ppl.read_one(ppl.TEST_EMAIL)
+        id_map = ep.request_identity_map()
+        assert (dbc.SE_DB, ppl.PEOPLE_COLLECT) in id_map
+        dbc.invalidate(ppl.PEOPLE_COLLECT)
+        assert (dbc.SE_DB, ppl.PEOPLE_COLLECT) not in id_map
+    assert ep.request_identity_map() is None
+
+
+def get_twice(url):
+    """
+    GET url, then GET it again with the ETag we got back.
+    """
+    first = TEST_CLIENT.get(url)
+    assert first.status_code == OK
+    assert first.headers.get('ETag')
+    second = TEST_CLIENT.get(
+        url, headers={'If-None-Match': first.headers['ETag']}
+    )
+    return first, second
+
+
+@pytest.mark.parametrize('url', [
+    ep.ENDPOINT_EP,
+    '/roles',
+    '/roles?type=codes',
+    ep.TEXT_EP,
+    f'{ep.PEOPLE_EP}/masthead',
+    f'{MANUSCRIPT_EP}/states',
+])
+def test_conditional_get(url):
+    first, second = get_twice(url)
+    assert second.status_code == NOT_MODIFIED
+    assert second.data == b''
+    assert second.headers['ETag'] == first.headers['ETag']
+
+
+def test_roles_etags_differ_by_type():
+    plain = TEST_CLIENT.get('/roles')
+    codes = TEST_CLIENT.get('/roles?type=codes')
+    assert plain.headers['ETag'] != codes.headers['ETag']
+
+
+def test_states_etag_changes_on_write():
+    title = 'ETag Manuscript'
+    if mt.exists(title):
+        mt.delete(title)
+    before = TEST_CLIENT.get(f'{MANUSCRIPT_EP}/states')
+    mt.create(title, 'Author', TEST_EMAIL, 'Text', 'Abstract', TEST_EMAIL)
+    with patch('data.manuscripts.manuscript.read',
+               wraps=mt.read) as read:
+        after = TEST_CLIENT.get(
+            f'{MANUSCRIPT_EP}/states',
+            headers={'If-None-Match': before.headers['ETag']},
+        )
+        assert read.call_count == 1
+    assert after.status_code == OK
+    assert title in after.get_json()['manuscripts']
+    with patch('data.manuscripts.manuscript.read') as read:
+        unchanged = TEST_CLIENT.get(
+            f'{MANUSCRIPT_EP}/states',
+            headers={'If-None-Match': after.headers['ETag']},
+        )
+        read.assert_not_called()
+    assert unchanged.status_code == NOT_MODIFIED
+    mt.delete(title)
+
+
+def test_permissions():
+    resp = TEST_CLIENT.post('/permissions', json={
+        'user_id': 'someone@nyu.edu',
+        'login_key': 'valid',
+        ep.CHECKS: [
+            {ep.FEATURE: 'people', ep.ACTION: 'create'},
+            {ep.FEATURE: 'people', ep.ACTION: 'read'},
+        ],
+    })
+    assert resp.status_code == OK
+    assert resp.get_json() == {'people': {'create': True, 'read': True}}
+
+
+def test_permissions_no_login_key():
+    resp = TEST_CLIENT.post('/permissions', json={
+        'user_id': 'someone@nyu.edu',
+        ep.CHECKS: [{ep.FEATURE: 'people', ep.ACTION: 'create'}],
+    })
+    assert resp.status_code == OK
+    assert resp.get_json() == {'people': {'create': False}}
+    assert not sec.is_permitted('people', 'create', 'someone@nyu.edu')
+
+
+@pytest.mark.parametrize('checks', [None, [], [{'feature': 'people'}],
+                                    ['people'],
+                                    [{'feature': ['people'],
+                                      'action': 'create'}],
+                                    [{'feature': 'people',
+                                      'action': ['create']}]])
+def test_permissions_bad_request(checks):
+    resp = TEST_CLIENT.post('/permissions', json={ep.CHECKS: checks})
+    assert resp.status_code == BAD_REQUEST
@@ -0,0 +1,75 @@
+import gzip
+import json
+from http.client import NOT_FOUND, NOT_MODIFIED, OK
+from unittest.mock import patch
+
+import data.text as txt
+import server.endpoints as ep
+import server.page_cache as pgc
+
+TEST_CLIENT = ep.app.test_client()
+
+BIG_PAGE = {txt.TITLE: 'Big', txt.TEXT: 'All about oceans. ' * 200}
+
+
+def test_rendered_page():
+    page = pgc.RenderedPage(BIG_PAGE, 'tag')
+    assert json.loads(page.body) == BIG_PAGE
+    assert json.loads(gzip.decompress(page.gzipped)) == BIG_PAGE
+
+
+def test_small_page_not_gzipped():
+    page = pgc.RenderedPage({txt.TITLE: 'x'}, 'tag')
+    assert page.gzipped is None
+
+
+def test_rebuild_on_write():
+    key = 'PageCacheTest'
+    if txt.read_one(key):
+        txt.delete_text(key)
+    txt.create_text(key, 'Title', 'Text')
+    version = txt.get_version()
+    assert (key, version) in pgc.rendered
+    assert (pgc.ALL_PAGES, version) in pgc.rendered
+    txt.update_text(key, 'New Title', 'Text')
+    new_version = txt.get_version()
+    assert (key, version) not in pgc.rendered
+    page = pgc.rendered[(key, new_version)]
+    assert json.loads(page.body)[txt.TITLE] == 'New Title'
+    txt.delete_text(key)
+    assert (key, txt.get_version()) not in pgc.rendered
+
+
+def test_text_page_endpoint():
+    txt.seed()
+    txt.load()
+    resp = TEST_CLIENT.get(f'{ep.TEXT_EP}/{txt.HOMEPAGE_KEY}')
+    assert resp.status_code == OK
+    assert resp.get_json() == txt.read_one(txt.HOMEPAGE_KEY)
+    again = TEST_CLIENT.get(f'{ep.TEXT_EP}/{txt.HOMEPAGE_KEY}',
+                            headers={'If-None-Match': resp.headers['ETag']})
+    assert again.status_code == NOT_MODIFIED
+
+
+def test_text_page_not_found():
+    resp = TEST_CLIENT.get(f'{ep.TEXT_EP}/NoSuchPage')
+    assert resp.status_code == NOT_FOUND
+
+
+def test_served_without_encoding():
+    key = 'BigPageCacheTest'
+    if txt.read_one(key):
+        txt.delete_text(key)
+    txt.create_text(key, BIG_PAGE[txt.TITLE], BIG_PAGE[txt.TEXT])
+    try:
+        TEST_CLIENT.get(f'{ep.TEXT_EP}/{key}')
+        with patch.object(pgc.ser, 'dumps') as dumps, \
+                patch.object(pgc.cmp, 'compress') as compress:
+            resp = TEST_CLIENT.get(f'{ep.TEXT_EP}/{key}',
+                                   headers={'Accept-Encoding': 'gzip'})
+            dumps.assert_not_called()
+            compress.assert_not_called()
+        assert resp.headers['Content-Encoding'] == pgc.cmp.GZIP
+        assert json.loads(gzip.decompress(resp.data)) == BIG_PAGE
+    finally:
+        txt.delete_text(key)
@@ -0,0 +1,56 @@
+import datetime
+import json
+from http.client import OK
+from unittest.mock import patch
+
+import pytest
+from bson import ObjectId
+
+import server.endpoints as ep
+import server.serialize as ser
+
+TEST_CLIENT = ep.app.test_client()
+
+OBJ_ID = ObjectId()
+WHEN = datetime.datetime(2024, 5, 1, 12, 30)
+
+DOC = {
+    '_id': OBJ_ID,
+    'created': WHEN,
+    'day': WHEN.date(),
+    'name': 'Someone',
+}
+
+EXPECTED = {
+    '_id': str(OBJ_ID),
+    'created': '2024-05-01T12:30:00',
+    'day': '2024-05-01',
+    'name': 'Someone',
+}
+
+
+@pytest.mark.skipif(ser.orjson is None, reason='orjson not installed')
+def test_dumps_fast():
+    assert json.loads(ser.dumps(DOC)) == EXPECTED
+
+
+def test_dumps_stdlib():
+    with patch.object(ser, 'orjson', None):
+        assert json.loads(ser.dumps(DOC)) == EXPECTED
+
+
+def test_dumps_big_int():
+    assert json.loads(ser.dumps({'n': 2 ** 70})) == {'n': 2 ** 70}
+
+
+def test_dumps_unknown_type():
+    with pytest.raises(TypeError):
+        ser.dumps({'x': object()})
+
+
+def test_endpoint_writes_raw_docs():
+    with patch('data.people.read', return_value={'a@nyu.edu': DOC}):
+        resp = TEST_CLIENT.get(ep.PEOPLE_EP)
+    assert resp.status_code == OK
+    assert resp.mimetype == ser.JSON
+    assert resp.get_json() == {'a@nyu.edu': EXPECTED}